@@ -0,0 +1,251 @@
+"""
+Headless batch processing: tile and run inference on many slides without Qt.
+
+    python cli.py path/to/slides --output results --tiling-jobs 2
+    python cli.py manifest.txt other.svs --output results
+
+Inputs are slide files (any format openslide reads: .svs, .tiff, .ndpi,
+.mrxs, ...), directories (searched for such slides) or manifests: .txt files
+with one slide path per line, or .csv files with a "slide" column (e.g. a
+previous run's summary.csv). Blank lines and # comments are ignored and
+relative paths are resolved against the manifest. Each slide gets
+<output>/<stem> (tiles) and <output>/<stem>_inference (results). Slides are
+pipelined: one slide's tiling overlaps another's inference, each stage running
+up to its --*-jobs slides at once. Per-slide timings (queueing and each stage)
+and throughput are written to <output>/summary.json and <output>/summary.csv.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import openslide
+
+import config
+from controller.detections import DETECTIONS_NAME, load_detections
+from controller.progress import ProgressInfo
+from controller.scheduler import Job, JobScheduler
+from controller.tissue_controller import load_tissue_index
+from controller.workflow import submit_image_processing
+
+STAGES = tuple(config.STAGE_CONCURRENCY)
+
+SUMMARY_FIELDS = (
+    "slide",
+    "status",
+    "error",
+    "seconds",
+    "queued_seconds",
+    *(f"{stage}_seconds" for stage in STAGES),
+    "slide_mb",
+    "mb_per_second",
+    "tissue_tiles",
+    "tiles_per_second",
+    "detections",
+)
+
+
+MANIFEST_SUFFIXES = (".txt", ".csv")
+
+
+def is_slide(path: Path) -> bool:
+    return path.is_file() and openslide.OpenSlide.detect_format(path) is not None
+
+
+def read_manifest(path: Path) -> list[Path]:
+    with open(path, newline="") as f:
+        if path.suffix.lower() == ".csv":
+            reader = csv.DictReader(f)
+            if "slide" not in (reader.fieldnames or ()):
+                raise ValueError(f"No 'slide' column in {path}")
+            lines = [row["slide"] or "" for row in reader]
+        else:
+            lines = f.read().splitlines()
+    slides = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        slide = Path(line)
+        slides.append(slide if slide.is_absolute() else path.parent / slide)
+    return slides
+
+
+def collect_slides(inputs: list[Path]) -> list[Path]:
+    slides = []
+    for path in inputs:
+        if path.is_dir():
+            slides.extend(p for p in sorted(path.iterdir()) if is_slide(p))
+        elif path.suffix.lower() in MANIFEST_SUFFIXES:
+            slides.extend(read_manifest(path))
+        else:
+            # unreadable slides fail (and are reported) like any other
+            slides.append(path)
+    return list(dict.fromkeys(slides))  # drop repeats, keep order
+
+
+def progress_printer(info: ProgressInfo, lock: threading.Lock, interval: float):
+    last = {"status": None, "time": 0.0}
+
+    def on_progress() -> None:
+        # statuses carry tile counts, so throttle all but the final update
+        now = time.monotonic()
+        if info.status == last["status"]:
+            return
+        if now - last["time"] < interval and info.percent_complete < 100:
+            return
+        last.update(status=info.status, time=now)
+        line = f"[{info.name}] {info.percent_complete:3d}% {info.status}"
+        with lock:
+            print(line, flush=True)
+
+    return on_progress
+
+
+def slide_summary(
+    slide: Path, tiles_dir: Path, inference_dir: Path, seconds: float
+) -> dict:
+    seconds = max(seconds, 1e-9)
+    slide_mb = slide.stat().st_size / 1e6 if slide.exists() else 0.0
+    summary = {
+        "slide": slide.as_posix(),
+        "seconds": round(seconds, 3),
+        "slide_mb": round(slide_mb, 3),
+        "mb_per_second": round(slide_mb / seconds, 3),
+    }
+
+    tissue_index = load_tissue_index(tiles_dir)
+    if tissue_index is not None and 0 in tissue_index:
+        summary["tissue_tiles"] = int(tissue_index[0].sum())
+        summary["tiles_per_second"] = round(summary["tissue_tiles"] / seconds, 3)
+
+    table_path = inference_dir / DETECTIONS_NAME
+    if table_path.exists():
+        summary["detections"] = len(load_detections(table_path)[0])
+    return summary
+
+
+def submit_slide(
+    scheduler: JobScheduler,
+    slide: Path,
+    output: Path,
+    model_path: str,
+    lock: threading.Lock,
+    interval: float,
+) -> Job:
+    info = ProgressInfo(slide.stem)
+    info.progress_changed.connect(progress_printer(info, lock, interval))
+    job = submit_image_processing(
+        slide.as_posix(),
+        (output / slide.stem).as_posix(),
+        (output / f"{slide.stem}_inference").as_posix(),
+        info,
+        model_path=model_path,
+        scheduler=scheduler,
+    )
+    job.state["started"] = time.perf_counter()
+    return job
+
+
+def wait_for_slide(job: Job, slide: Path, output: Path, lock: threading.Lock) -> dict:
+    status, error = "ok", ""
+    try:
+        job.result()
+    except Exception as exc:
+        status, error = "error", str(exc)
+        with lock:
+            print(f"[{job.name}] failed: {exc}", file=sys.stderr, flush=True)
+    # wall time runs from submission; slides finish out of order
+    seconds = job.state.get("finished", time.perf_counter()) - job.state["started"]
+
+    summary = slide_summary(
+        slide, output / slide.stem, output / f"{slide.stem}_inference", seconds
+    )
+    summary.update(status=status, error=error)
+    if job.progress_info.timings.enabled:
+        summary["stages"] = job.progress_info.timings.summary()
+    summary["queued_seconds"] = round(job.queued_seconds, 3)
+    for stage, stage_seconds in job.stage_seconds.items():
+        summary[f"{stage}_seconds"] = round(stage_seconds, 3)
+    return summary
+
+
+def write_summaries(
+    output: Path, summaries: list[dict], limits: dict[str, int], seconds: float
+):
+    batch = {
+        "slides": len(summaries),
+        "failed": sum(s["status"] != "ok" for s in summaries),
+        "stage_jobs": limits,
+        "seconds": round(seconds, 3),
+        "slides_per_hour": round(len(summaries) / seconds * 3600, 3),
+        "per_slide": summaries,
+    }
+    (output / "summary.json").write_text(json.dumps(batch, indent=2))
+    with open(output / "summary.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow({field: summary.get(field, "") for field in SUMMARY_FIELDS})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Tile and run inference on slides without the GUI"
+    )
+    parser.add_argument(
+        "inputs", type=Path, nargs="+", help="Slides, directories or manifests"
+    )
+    parser.add_argument("--output", type=Path, required=True)
+    for stage in STAGES:
+        parser.add_argument(
+            f"--{stage}-jobs",
+            type=int,
+            default=config.STAGE_CONCURRENCY[stage],
+            help=f"Slides in the {stage} stage at once",
+        )
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument(
+        "--progress-interval", type=float, default=5.0, help="Seconds between lines"
+    )
+    args = parser.parse_args()
+
+    try:
+        slides = collect_slides(args.inputs)
+    except ValueError as exc:
+        sys.exit(str(exc))
+    if not slides:
+        sys.exit("No slides found")
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    limits = {stage: getattr(args, f"{stage}_jobs") for stage in STAGES}
+    scheduler = JobScheduler(limits)
+    lock = threading.Lock()
+    start = time.perf_counter()
+    jobs = []
+    for slide in slides:
+        job = submit_slide(
+            scheduler, slide, args.output, args.model, lock, args.progress_interval
+        )
+        job.add_done_callback(
+            lambda job: job.state.setdefault("finished", time.perf_counter())
+        )
+        jobs.append(job)
+    summaries = [
+        wait_for_slide(job, slide, args.output, lock)
+        for job, slide in zip(jobs, slides)
+    ]
+    scheduler.shutdown()
+    write_summaries(args.output, summaries, limits, time.perf_counter() - start)
+
+    failed = [s["slide"] for s in summaries if s["status"] != "ok"]
+    print(f"Processed {len(slides) - len(failed)}/{len(slides)} slides")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+
 import torch
 
 # determine the device to be used for training and evaluation
@@ -12,3 +15,121 @@ INPUT_IMAGE_HEIGHT: int = 512
 
 # Post Processing
 CUTOFF = 0.5
+
+# Tiling: number of worker processes used to split the tile grid (1 = serial)
+TILING_WORKERS: int = min(8, os.cpu_count() or 1)
+
+# Tissue detection: longest edge of the thumbnail used to build the tile mask
+TISSUE_THUMBNAIL_SIZE: int = 2048
+
+# Tile storage: pack every tile of a slide into one mmap-able file instead of
+# one PNG per tile
+PACKED_TILES: bool = True
+
+# Streaming: hand level-0 tiles straight from the tiler to inference through a
+# bounded queue instead of re-reading them from the tile store
+STREAM_TILES_TO_INFERENCE: bool = True
+STREAM_QUEUE_SIZE: int = 64
+
+# Level-0 tiles: read from the best native pyramid level for the output
+# magnification and area-average the remainder instead of LANCZOS-downsizing
+# full-resolution reads
+NATIVE_LEVEL_READS: bool = True
+
+# Strip reads: tiles are cut from regions of STRIP_ROWS×STRIP_COLS tiles read
+# in one call; lower these to bound memory on very large slides
+STRIP_ROWS: int = 1
+STRIP_COLS: int = 8
+
+# Inference batching: tiles per forward pass and DataLoader decode workers
+INFERENCE_BATCH_SIZE: int = 8
+INFERENCE_LOADER_WORKERS: int = 2
+
+# Segmentation model: default checkpoint, how many loaded models to keep per
+# process, and whether to load + warm it up in the background at start-up
+MODEL_PATH: str = (
+    Path("assets").joinpath("ai_models", "old_best_checkpoint.ckpt").as_posix()
+)
+MODEL_CACHE_SIZE: int = 2
+MODEL_WARM_UP: bool = True
+
+# Inference backend: "eager", "torchscript", "compile" or "onnx" (needs
+# onnxruntime). Fast backends are only used when their masks agree with the
+# eager model on the first real batch to within this fraction of pixels.
+INFERENCE_BACKEND: str = "eager"
+BACKEND_PARITY_TOLERANCE: float = 1e-4
+
+# Inference preparation: Conv+BN fusion (kept only within FUSION_TOLERANCE of
+# the unfused logits), channels_last layout and CPU bf16 autocast
+CHANNELS_LAST: bool = True
+INFERENCE_BF16: bool = False
+FUSION_TOLERANCE: float = 1e-3
+
+# Opt-in int8 inference (CPU only): static post-training quantization
+# calibrated on tissue tiles of the first slide processed with a checkpoint.
+# A checkpoint's int8 model is used only if its mean Dice against fp32 on
+# held-out tiles reaches QUANTIZATION_MIN_DICE.
+QUANTIZATION: bool = False
+QUANTIZATION_CALIBRATION_TILES: int = 32
+QUANTIZATION_MIN_DICE: float = 0.95
+
+# Morphological closing before component labelling: "exact" (full-size
+# ellipse), "downscaled" (ellipse at 1/CLOSING_SCALE resolution, fastest,
+# least accurate) or "decomposed" (octagon from iterated 3×3 kernels).
+# "downscaled" fills gaps in whole CLOSING_SCALE-pixel cells: on solid
+# regions its closing is ~0.99 IoU of the exact one, on masks of scattered
+# specks nearer 0.87, as gap edges come out blocky
+CLOSING_MODE: str = "exact"
+CLOSING_SCALE: int = 4
+
+# Inference output: "detections" writes one per-slide table of circles
+# (controller.detections) drawn as vector overlays; "masks" writes every
+# tissue tile's mask run-length encoded into one per-slide file
+# (controller.mask_store)
+ANNOTATION_OUTPUT: str = "detections"
+# Merge detections cut by tile borders into whole objects at the end of a
+# slide (detections output only)
+MERGE_BORDER_DETECTIONS: bool = True
+
+# Keep uint8-quantized probability maps of inferred tiles in the inference
+# output (probabilities.pack) so infer_controller.repostprocess can redo
+# thresholding and postprocessing without the model
+SAVE_PROBABILITY_MAPS: bool = False
+
+# Opt-in content-addressed cache of per-tile model outputs, keyed by tile
+# pixels, checkpoint digest and preprocessing; least recently used entries are
+# dropped beyond INFERENCE_CACHE_BYTES of disk under INFERENCE_CACHE_DIR.
+# Entries store probabilities quantized to 8 bits, and with the cache on every
+# tile is postprocessed from those, so detections can differ slightly from an
+# uncached run (whose postprocessing sees the float32 model output)
+INFERENCE_CACHE: bool = False
+INFERENCE_CACHE_DIR: str = (
+    Path.home().joinpath(".cache", "gains", "inference_cache").as_posix()
+)
+INFERENCE_CACHE_BYTES: int = 2 * 1024**3
+
+# Multi-process CPU inference (stored tiles only, so it turns off streaming):
+# a slide's tiles are split across INFERENCE_SHARDS worker processes, each
+# with its own model and INFERENCE_SHARD_THREADS torch threads (0 = share
+# the cores evenly). "auto" times the split on this machine once per
+# checkpoint. 1 = infer in this process.
+INFERENCE_SHARDS: int | str = 1
+INFERENCE_SHARD_THREADS: int = 0
+
+# Stage timing: every tile's read_region, whiteness check, composite/resize,
+# PNG encode/save, decode/preprocess, forward pass, postprocessing and mask
+# save are timed and written per slide to the inference output as a summary
+# table (timings.txt) and a Chrome/Perfetto trace (timings.trace.json).
+# Per-stage totals are always kept; trace events beyond
+# STAGE_TRACE_MAX_EVENTS per slide are only counted.
+STAGE_TIMING: bool = True
+STAGE_TRACE_MAX_EVENTS: int = 200_000
+
+# Multi-slide pipeline: slides run through tiling, inference and
+# postprocessing stage queues, each allowing this many jobs at once, on a
+# fixed pool of worker threads
+STAGE_CONCURRENCY: dict[str, int] = {
+    "tiling": 1,
+    "inference": 1,
+    "postprocessing": 1,
+}
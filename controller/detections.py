@@ -0,0 +1,257 @@
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+DETECTIONS_NAME = "detections.bin"
+DETECTION_INDEX_NAME = "detections_index.npz"
+
+# Edge of a spatial index cell in slide pixels (one level-0 tile)
+INDEX_CELL_SIZE = 1024
+
+# One row per detected glomerulus. x, y and radius are in slide (level-0)
+# pixels; row/col/level identify the tile it was detected in.
+DETECTION_DTYPE = np.dtype(
+    [
+        ("x", "<f4"),
+        ("y", "<f4"),
+        ("radius", "<f4"),
+        ("row", "<i4"),
+        ("col", "<i4"),
+        ("level", "<i2"),
+        ("score", "<f4"),
+    ]
+)
+
+_MAGIC = b"GAINSDT1"
+# magic, record size, level-0 pixels per pixel of a level-0 tile
+_HEADER = struct.Struct("<8sIf")
+
+
+def _temp_path(path: Path) -> Path:
+    return path.with_name(path.name + ".tmp")
+
+
+class DetectionWriter:
+    """
+    Appends detection records to a per-slide binary table as they arrive.
+    With a `merger` (controller.tile_merge.FragmentMerger) collecting the
+    objects cut by tile borders, their merged records are appended on close.
+    The table and its index are written next to their final paths and only
+    replace them on close(); discard() drops them, keeping an earlier run's.
+    """
+
+    def __init__(self, path: str | os.PathLike, tile_scale: float, merger=None):
+        self.path = Path(path)
+        self.merger = merger
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tile_scale = tile_scale
+        self._temp_path = _temp_path(self.path)
+        self._file = open(self._temp_path, "wb")
+        self._records = []  # kept for the spatial index built on close
+        self._file.write(_HEADER.pack(_MAGIC, DETECTION_DTYPE.itemsize, tile_scale))
+        self.count = 0
+
+    def write(self, records: np.ndarray) -> None:
+        if len(records) == 0:
+            return
+        self._file.write(records.astype(DETECTION_DTYPE, copy=False).tobytes())
+        self._file.flush()  # readers and crash recovery see whole batches
+        self.count += len(records)
+        self._records.append(records)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        if self.merger is not None:
+            self.write(self.merger.merge(self.tile_scale))
+        self._file.close()
+        records = (
+            np.concatenate(self._records)
+            if self._records
+            else np.empty(0, dtype=DETECTION_DTYPE)
+        )
+        index_path = self.path.with_name(DETECTION_INDEX_NAME)
+        DetectionIndex.build(records, self.tile_scale).save(_temp_path(index_path))
+        os.replace(self._temp_path, self.path)
+        os.replace(_temp_path(index_path), index_path)
+
+    def discard(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class DetectionBuffer:
+    """
+    In-memory stand-in for a DetectionWriter in inference worker processes;
+    the parent appends the collected records to the real table.
+    """
+
+    def __init__(self, tile_scale: float, merger=None):
+        self.tile_scale = tile_scale
+        self.merger = merger
+        self.records: list[np.ndarray] = []
+
+    def write(self, records: np.ndarray) -> None:
+        if len(records):
+            self.records.append(records)
+
+
+def detection_records(
+    circles: np.ndarray,
+    row: int,
+    col: int,
+    level: int,
+    tile_shape: tuple[int, int],
+    tile_scale: float,
+) -> np.ndarray:
+    """Convert (x, y, radius, score) circles in tile pixels to table records."""
+    tile_h, tile_w = tile_shape
+    records = np.empty(len(circles), dtype=DETECTION_DTYPE)
+    records["x"] = (col * tile_w + circles[:, 0]) * tile_scale
+    records["y"] = (row * tile_h + circles[:, 1]) * tile_scale
+    records["radius"] = circles[:, 2] * tile_scale
+    records["row"] = row
+    records["col"] = col
+    records["level"] = level
+    records["score"] = circles[:, 3]
+    return records
+
+
+def load_detections(path: str | os.PathLike) -> tuple[np.ndarray, float]:
+    """Return the detection records and the table's level-0 tile scale."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        magic, record_size, tile_scale = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or record_size != DETECTION_DTYPE.itemsize:
+            raise RuntimeError(f"Not a detection table: {path}")
+        # a partially written trailing record (e.g. after a crash) is ignored
+        count = (path.stat().st_size - _HEADER.size) // record_size
+        records = np.fromfile(f, dtype=DETECTION_DTYPE, count=count)
+    return records, tile_scale
+
+
+class DetectionIndex:
+    """
+    Uniform grid over detection centres for rectangle queries in slide
+    pixels. Detections are kept sorted by cell in row-major order, so every
+    grid row a query spans is one contiguous slice.
+    """
+
+    def __init__(
+        self,
+        table: np.ndarray,
+        order: np.ndarray,
+        cell_start: np.ndarray,
+        grid_shape: tuple[int, int],
+        cell_size: int,
+        tile_scale: float,
+    ):
+        self.table = table  # records in table (file) order
+        self.order = order  # table ids sorted by cell
+        self.cell_start = cell_start  # first position of each cell in `order`
+        self.rows, self.cols = grid_shape
+        self.cell_size = cell_size
+        self.tile_scale = tile_scale
+
+        # contiguous coordinate columns in cell order for the exact filter
+        sorted_table = table[order]
+        self._x = np.ascontiguousarray(sorted_table["x"])
+        self._y = np.ascontiguousarray(sorted_table["y"])
+        self._radius = np.ascontiguousarray(sorted_table["radius"])
+        self.max_radius = float(self._radius.max()) if len(table) else 0.0
+
+    @classmethod
+    def build(
+        cls, table: np.ndarray, tile_scale: float, cell_size: int = INDEX_CELL_SIZE
+    ) -> "DetectionIndex":
+        cell_x = np.maximum(table["x"] // cell_size, 0).astype(np.int64)
+        cell_y = np.maximum(table["y"] // cell_size, 0).astype(np.int64)
+        cols = int(cell_x.max()) + 1 if len(table) else 1
+        rows = int(cell_y.max()) + 1 if len(table) else 1
+
+        cells = cell_y * cols + cell_x
+        order = np.argsort(cells, kind="stable")
+        cell_start = np.searchsorted(cells[order], np.arange(rows * cols + 1))
+        return cls(table, order, cell_start, (rows, cols), cell_size, tile_scale)
+
+    def save(self, path: str | os.PathLike) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                order=self.order,
+                cell_start=self.cell_start,
+                grid_shape=np.array([self.rows, self.cols]),
+                cell_size=np.array(self.cell_size),
+            )
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _candidates(self, x0, y0, x1, y1, margin: float) -> np.ndarray:
+        """Cell-order positions of detections in cells the rectangle touches."""
+        c0 = max(int((x0 - margin) // self.cell_size), 0)
+        c1 = min(int((x1 + margin) // self.cell_size), self.cols - 1)
+        r0 = max(int((y0 - margin) // self.cell_size), 0)
+        r1 = min(int((y1 + margin) // self.cell_size), self.rows - 1)
+        if c0 > c1 or r0 > r1:
+            return np.empty(0, dtype=np.int64)
+
+        row_cells = np.arange(r0, r1 + 1) * self.cols
+        starts = self.cell_start[row_cells + c0]
+        stops = self.cell_start[row_cells + c1 + 1]
+        return np.concatenate(
+            [np.arange(start, stop) for start, stop in zip(starts, stops)]
+        )
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Table ids of the circles overlapping the rectangle."""
+        pos = self._candidates(x0, y0, x1, y1, self.max_radius)
+        x, y, radius = self._x[pos], self._y[pos], self._radius[pos]
+        hit = (x + radius >= x0) & (x - radius <= x1)
+        hit &= (y + radius >= y0) & (y - radius <= y1)
+        return self.order[pos[hit]]
+
+    def count(self, x0: float, y0: float, x1: float, y1: float) -> int:
+        """Number of detections whose centre lies inside the rectangle."""
+        pos = self._candidates(x0, y0, x1, y1, 0.0)
+        x, y = self._x[pos], self._y[pos]
+        return int(np.count_nonzero((x >= x0) & (x < x1) & (y >= y0) & (y < y1)))
+
+
+def load_detection_index(inference_root: str | os.PathLike) -> DetectionIndex | None:
+    """
+    Open the detection table of an inference output directory with its
+    spatial index, rebuilding the index if it is missing or out of date
+    (e.g. after an interrupted run). None when there is no table.
+    """
+    inference_root = Path(inference_root)
+    table_path = inference_root / DETECTIONS_NAME
+    if not table_path.exists():
+        return None
+    table, tile_scale = load_detections(table_path)
+
+    index_path = inference_root / DETECTION_INDEX_NAME
+    if index_path.exists():
+        with np.load(index_path) as data:
+            if len(data["order"]) == len(table):
+                return DetectionIndex(
+                    table,
+                    data["order"],
+                    data["cell_start"],
+                    tuple(int(n) for n in data["grid_shape"]),
+                    int(data["cell_size"]),
+                    tile_scale,
+                )
+    return DetectionIndex.build(table, tile_scale)
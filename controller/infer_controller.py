@@ -1,18 +1,103 @@
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from queue import Empty, Queue
+from typing import NamedTuple
 
 import cv2
 import numpy as np
 import torch
-from PIL import Image
-from torchvision import transforms
 
 import config
+from controller.detections import (
+    DETECTION_INDEX_NAME,
+    DETECTIONS_NAME,
+    DetectionBuffer,
+    DetectionWriter,
+    detection_records,
+)
 from controller.image_controller import __mostly_white
+from controller.inference_backend import prepare_backend
+from controller.inference_cache import InferenceCache, tile_digest
+from controller.mask_store import MASK_STORE_NAME, encode_mask
+from controller.model_registry import ModelRegistry
+from controller.progress import ProgressInfo
+from controller.quantization import (
+    NoCalibrationTiles,
+    checkpoint_digest,
+    load_quantized,
+)
+from controller.tile_dataset import (
+    TileDataset,
+    empty_tile_batch,
+    fit_tile_into,
+    is_white_tile,
+    normalize_batch,
+    tile_batches,
+)
+from controller.tile_merge import FragmentMerger, TileFragments, tile_fragments
+from controller.tile_store import PackedTileStore, TileStore, open_tile_store
+from controller.timing import NO_TIMINGS, StageTimings
+from controller.tissue_controller import load_tissue_index
+from controller.wsi_controller import LEVEL0_TILE_SCALE, read_tissue_tiles
+from model.ai_models.inference_prep import prepare_for_inference
 from model.ai_models.nested_unet import NestedUNet as UNet
-from state.progress_info import ProgressInfo
 
+PROBABILITY_STORE_NAME = "probabilities.pack"
 
-def __load_model(model_path: Path, device: torch.device, out_size: tuple[int, int]):
+
+class TileBuffer:
+    """
+    put()-only stand-in for a per-slide packed store (probability maps,
+    masks) in worker processes.
+    """
+
+    def __init__(self):
+        self.tiles: list[tuple[int, int, int, bytes]] = []
+
+    def put(self, level: int, row: int, col: int, data: bytes) -> None:
+        self.tiles.append((level, row, col, data))
+
+
+class InferenceOutputs(NamedTuple):
+    detections: DetectionWriter | None
+    masks: TileStore | None
+    probabilities: TileStore | None
+    cache: InferenceCache | None
+    stale: list[Path]  # earlier outputs superseded once the run succeeds
+
+
+class ShardResult(NamedTuple):
+    tiles: int
+    records: list[np.ndarray]
+    merger: FragmentMerger | None
+    probabilities: list[tuple[int, int, int, bytes]]
+    masks: list[tuple[int, int, int, bytes]]
+    cache_hits: int
+    cache_misses: int
+    timings: StageTimings
+
+
+# Model and cache owned by an inference worker process (see
+# __init_inference_worker)
+_worker_model = None
+_worker_cache: InferenceCache | None = None
+
+# The shard worker pool outlives a slide, so its workers load the model once;
+# it is replaced when the checkpoint or the worker layout changes
+_shard_pool: tuple[tuple, ProcessPoolExecutor] | None = None
+_shard_pool_lock = threading.Lock()
+
+
+def __load_checkpoint(
+    model_path: Path, device: torch.device, out_size: tuple[int, int]
+):
     if model_path.suffix == ".pth":
         # Full model file
         model = torch.load(model_path, map_location=device, weights_only=False)
@@ -25,23 +110,115 @@ def __load_model(model_path: Path, device: torch.device, out_size: tuple[int, in
     return model
 
 
-def __get_image_paths(input_path: Path):
-    if input_path.is_dir():
-        return sorted([p for p in input_path.glob("*.png") if "_mask" not in p.stem])
-    elif input_path.is_file():
-        return [input_path]
-    else:
-        raise ValueError(f"Invalid input path: {input_path}")
+def __load_model(model_path: Path, device: torch.device, out_size: tuple[int, int]):
+    model = __load_checkpoint(model_path, device, out_size)
+    return prepare_for_inference(
+        model,
+        channels_last=config.CHANNELS_LAST,
+        bf16=config.INFERENCE_BF16,
+        tolerance=config.FUSION_TOLERANCE,
+    )
+
 
+def __load_inference_model(
+    model_path: Path, device: torch.device, out_size: tuple[int, int]
+):
+    model = __load_model(model_path, device, out_size)
+    return prepare_backend(model, model_path, device, out_size)
 
-def __preprocess_image(image_path: Path, transform):
-    img = Image.open(image_path).convert("RGB")
-    return transform(img)
 
+# Loaded models are shared by every slide processed in this process
+MODEL_REGISTRY = ModelRegistry(
+    __load_inference_model, max_models=config.MODEL_CACHE_SIZE
+)
 
-def __postprocess_image(
-    binary_img: np.ndarray, looseness: int = 30, min_radius: int = 15
+
+def warm_up_model(model_path: str | None = None):
+    if model_path is None:
+        model_path = config.MODEL_PATH
+    if not Path(model_path).exists():
+        return None
+    return MODEL_REGISTRY.warm_up(
+        model_path,
+        config.DEVICE,
+        (config.INPUT_IMAGE_HEIGHT, config.INPUT_IMAGE_WIDTH),
+    )
+
+
+def __report_progress(progress_info: ProgressInfo, i: int, total: int) -> None:
+    progress_info.percent_complete = int(i / total * 100)
+    progress_info.status = str(f"Running inference ({i}/{total})")
+    progress_info.progress_changed.emit()
+
+
+def __close_mask(
+    foreground: np.ndarray,
+    looseness: int,
+    mode: str | None = None,
+    scale: int | None = None,
 ) -> np.ndarray:
+    if mode is None:
+        mode = config.CLOSING_MODE
+    if scale is None:
+        scale = config.CLOSING_SCALE
+    if mode == "exact":
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (looseness, looseness))
+        return cv2.morphologyEx(foreground, cv2.MORPH_CLOSE, kernel)
+
+    if mode == "downscaled":
+        # close at 1/scale resolution with a proportionally smaller ellipse; a
+        # cell with any foreground counts (max pooling), so thin or speckled
+        # regions the exact closing would merge do not vanish on the way down
+        h, w = foreground.shape
+        small = cv2.resize(
+            foreground, (w // scale, h // scale), interpolation=cv2.INTER_AREA
+        )
+        _, small = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY)
+        size = max(looseness // scale, 1)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        closed = cv2.morphologyEx(small, cv2.MORPH_CLOSE, kernel)
+        # fill the cells the closing added and those inside the closed region;
+        # cells on its border keep their full-resolution pixels, so the pooling
+        # does not grow the outline
+        interior = cv2.erode(closed, np.ones((3, 3), np.uint8))
+        fill = cv2.bitwise_or(cv2.bitwise_and(closed, cv2.bitwise_not(small)), interior)
+        fill = cv2.resize(fill, (w, h), interpolation=cv2.INTER_NEAREST)
+        # closing never removes foreground; keep full-resolution detail
+        return cv2.bitwise_or(fill, foreground)
+
+    if mode == "decomposed":
+        # an octagon grown from alternating 3×3 square/cross steps stands in
+        # for the ellipse; every step is a cheap 3×3 kernel
+        square = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        cross = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+        steps = [square if i % 2 == 0 else cross for i in range(looseness // 2)]
+        closed = foreground
+        for kernel in steps:
+            closed = cv2.dilate(closed, kernel)
+        for kernel in reversed(steps):
+            closed = cv2.erode(closed, kernel)
+        return closed
+
+    raise ValueError(f"Unknown closing mode: {mode}")
+
+
+def __detect_circles(
+    binary_img: np.ndarray,
+    looseness: int = 30,
+    min_radius: int = 15,
+    closing: str | None = None,
+    foreground_prob: np.ndarray | None = None,
+    origin: tuple[int, int] | None = None,
+) -> tuple[np.ndarray, TileFragments | None]:
+    """
+    Reduce a mask tile (black foreground on white) to minimum enclosing
+    circles, as an (n, 4) float array of x, y, radius, score in tile pixels.
+    Score is the mean of `foreground_prob` over the closed component (1.0
+    when no probabilities are given).
+
+    With the tile's grid `origin`, components touching the tile border are
+    returned as fragments for cross-tile merging instead of as circles.
+    """
     # Ensure binary (0 or 255)
     _, binary = cv2.threshold(binary_img, 127, 255, cv2.THRESH_BINARY)
 
@@ -49,25 +226,43 @@ def __postprocess_image(
     inverted = cv2.bitwise_not(binary)
 
     if looseness > 1:
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (looseness, looseness))
-        inverted = cv2.morphologyEx(inverted, cv2.MORPH_CLOSE, kernel)
+        inverted = __close_mask(inverted, looseness, closing)
 
     # Connected components on inverted (foreground=255)
     num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
         inverted, connectivity=8
     )
 
-    # Start with white background
-    output = np.full_like(binary, 255, dtype=np.uint8)
+    scores = np.ones(num_labels)
+    if foreground_prob is not None and num_labels > 1:
+        # per-component mean probability in a single pass over the tile
+        flat = labels.ravel()
+        sums = np.bincount(flat, weights=foreground_prob.ravel(), minlength=num_labels)
+        scores = sums / np.maximum(np.bincount(flat, minlength=num_labels), 1)
 
-    # Loop over each component (skip background label 0)
+    fragments, border = None, set()
+    if origin is not None:
+        fragments = tile_fragments(labels, stats, origin, foreground_prob)
+        border = fragments.fragments.keys()
+
+    circles = []
+    # Loop over each component (skip background label 0); all per-component
+    # work is restricted to its bounding box from `stats`
     for i in range(1, num_labels):
-        # Mask for this component
-        mask = (labels == i).astype("uint8")
+        if i in border:
+            continue
+        left, top, width, height, _ = stats[i]
+
+        # The minimum enclosing circle never exceeds the circle through the
+        # bounding box corners, so small components are rejected outright
+        if np.hypot(width, height) / 2 < min_radius:
+            continue
 
-        # Pixel coordinates
-        points = np.column_stack(np.where(mask > 0))
-        points = np.flip(points, axis=1)  # (row, col) -> (x, y)
+        # Pixel coordinates, in the same row-major order as a full-image scan
+        rows, cols = np.nonzero(
+            labels[top : top + height, left : left + width] == i
+        )
+        points = np.column_stack((cols + left, rows + top))  # (x, y)
 
         if len(points) == 0:
             continue
@@ -76,87 +271,941 @@ def __postprocess_image(
         (x, y), radius = cv2.minEnclosingCircle(points)
         if radius < min_radius:
             continue
+        circles.append((x, y, radius, scores[i]))
+
+    return np.array(circles, dtype=np.float64).reshape(-1, 4), fragments
 
-        # Draw black filled circle
-        center = (int(x), int(y))
-        radius = int(radius)
-        cv2.circle(output, center, radius, 0, -1)
 
+def __draw_circles(circles: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    # Start with white background
+    output = np.full(shape, 255, dtype=np.uint8)
+    for x, y, radius, _ in circles:
+        # Draw black filled circle
+        cv2.circle(output, (int(x), int(y)), int(radius), 0, -1)
     return output
 
 
+def __postprocess_image(
+    binary_img: np.ndarray,
+    looseness: int = 30,
+    min_radius: int = 15,
+    closing: str | None = None,
+) -> np.ndarray:
+    circles, _ = __detect_circles(binary_img, looseness, min_radius, closing)
+    return __draw_circles(circles, binary_img.shape)
+
+
+def __quantize_probability(prob: np.ndarray) -> np.ndarray:
+    # uint8 steps of 1/255
+    return np.round(prob * 255).astype(np.uint8)
+
+
+def __dequantize_probability(quantized: np.ndarray) -> np.ndarray:
+    return quantized.astype(np.float32) / 255
+
+
+def __encode_probability(prob: np.ndarray) -> bytes:
+    # quantized probabilities, PNG-compressed
+    return cv2.imencode(".png", __quantize_probability(prob))[1].tobytes()
+
+
+def __decode_probability(data: bytes) -> np.ndarray:
+    quantized = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    return __dequantize_probability(quantized)
+
+
+def __postprocess_tile(
+    prob: np.ndarray,
+    row: int,
+    col: int,
+    level: int,
+    masks: TileStore | None,
+    detections: DetectionWriter | None,
+    *,
+    cutoff: float | None = None,
+    looseness: int = 30,
+    min_radius: int = 15,
+    timings: StageTimings = NO_TIMINGS,
+) -> np.ndarray | None:
+    """
+    Turn a tile's probability map into detection records, or put its mask
+    into `masks` when there is no detection table. Returns the records, if
+    any.
+    """
+    if cutoff is None:
+        cutoff = config.CUTOFF
+    with timings.span("postprocess"):
+        # mask_np = __postprocess_mask(pred)
+        mask_np = (prob > cutoff) * 255
+        mask_np = mask_np.astype(np.uint8)
+        if __mostly_white(mask_np):
+            return None
+
+        # the model predicts background high, so foreground is 1 - prob
+        merger = detections.merger if detections is not None else None
+        tile_h, tile_w = mask_np.shape
+        circles, fragments = __detect_circles(
+            mask_np,
+            looseness,
+            min_radius,
+            foreground_prob=1.0 - prob,
+            origin=None if merger is None else (col * tile_w, row * tile_h),
+        )
+
+        if detections is not None:
+            if fragments is not None:
+                merger.add(level, row, col, fragments)
+            return detection_records(
+                circles, row, col, level, mask_np.shape, detections.tile_scale
+            )
+
+    # Save predicted mask (circles are drawn black)
+    if masks is not None:
+        with timings.span("mask_save"):
+            mask_np = __draw_circles(circles, mask_np.shape)
+            masks.put(level, row, col, encode_mask(mask_np == 0))
+    return None
+
+
+def __infer_batch(
+    model,
+    tile_keys: list[tuple[int, int]],
+    img_batch: torch.Tensor,  # uint8 NHWC, see controller.tile_dataset
+    masks: TileStore | None,
+    detections: DetectionWriter | None = None,
+    level: int = 0,
+    probabilities: TileStore | None = None,
+    cache: InferenceCache | None = None,
+    digests: list[str] | None = None,
+    timings: StageTimings = NO_TIMINGS,
+) -> None:
+    # cached tiles skip the forward pass; their maps come back quantized
+    probs, encoded = [None] * len(tile_keys), [None] * len(tile_keys)
+    if cache is not None:
+        with timings.span("cache_lookup"):
+            for i, digest in enumerate(digests):
+                encoded[i] = cache.get(digest)
+                if encoded[i] is not None:
+                    probs[i] = __decode_probability(encoded[i])
+
+    missing = [i for i, prob in enumerate(probs) if prob is None]
+    if missing:
+        if len(missing) < len(tile_keys):
+            img_batch = img_batch[missing]
+        # uint8 goes to the device (a quarter of the float bytes) and is
+        # normalized there; .cpu() waits for the device, so this covers the
+        # whole forward pass
+        with timings.span("forward"), torch.no_grad():
+            inputs = normalize_batch(img_batch.to(config.DEVICE, non_blocking=True))
+            logits = model(inputs)
+            fresh = torch.sigmoid(logits).squeeze(1).cpu().numpy()
+        for i, prob in zip(missing, fresh):
+            if cache is not None:
+                with timings.span("cache_store"):
+                    quantized = __quantize_probability(prob)
+                    encoded[i] = cv2.imencode(".png", quantized)[1].tobytes()
+                    cache.put(digests[i], encoded[i])
+                # postprocessed from the stored map, as a later cache hit is
+                prob = __dequantize_probability(quantized)
+            probs[i] = prob
+
+    records = []
+    for (row, col), prob, data in zip(tile_keys, probs, encoded):
+        if probabilities is not None:
+            with timings.span("probability_save"):
+                data = data if data is not None else __encode_probability(prob)
+                probabilities.put(level, row, col, data)
+        tile_records = __postprocess_tile(
+            prob, row, col, level, masks, detections, timings=timings
+        )
+        if tile_records is not None:
+            records.append(tile_records)
+
+    if records:
+        detections.write(np.concatenate(records))
+
+
+def __infer_loaded_batch(
+    model,
+    batch,
+    masks,
+    detections,
+    level: int,
+    probabilities,
+    cache: InferenceCache | None,
+    timings: StageTimings = NO_TIMINGS,
+) -> int:
+    # one TileDataset batch; tiles flagged as white are skipped
+    rows, cols, img_batch, white, digests, timing = batch
+    if timings.enabled:
+        # spans measured in the loader workers, see TileDataset
+        for pid, tid, start, decoded, end in timing.tolist():
+            timings.add("decode_preprocess", start, decoded, pid, tid)
+            timings.add("whiteness", decoded, end, pid, tid)
+    keep = ~white
+    if keep.any():
+        __infer_batch(
+            model,
+            list(zip(rows[keep].tolist(), cols[keep].tolist())),
+            img_batch if keep.all() else img_batch[keep],
+            masks,
+            detections,
+            level,
+            probabilities,
+            cache,
+            [d for d, k in zip(digests, keep.tolist()) if k],
+            timings,
+        )
+    return len(rows)
+
+
 def run_inference(
     model,
-    image_paths,
-    transform,
+    tiles_root: str,
+    tile_keys: list[tuple[int, int]],
+    input_size: tuple[int, int],
     output_dir: str,
     progress_info: ProgressInfo,
+    *,
+    level: int = 0,
+    batch_size: int | None = None,
+    detections: DetectionWriter | None = None,
+    masks: TileStore | None = None,
+    probabilities: TileStore | None = None,
+    cache: InferenceCache | None = None,
 ):
+    if batch_size is None:
+        batch_size = config.INFERENCE_BATCH_SIZE
     output_dir = Path(output_dir)
-    device = config.DEVICE
     output_dir.mkdir(parents=True, exist_ok=True)
 
     progress_info.status = "Running inference"
     progress_info.progress_changed.emit()
-    for i, img_path in enumerate(image_paths):
-        img_tensor = __preprocess_image(img_path, transform).to(device)
-        if __mostly_white(
-            img_tensor.detach().cpu().numpy(), white_cutoff=235, max_white_ratio=0.97
-        ):
-            progress_info.percent_complete = int(i / len(image_paths) * 100)
-            progress_info.status = str(f"Running inference ({i}/{len(image_paths)})")
-            progress_info.progress_changed.emit()
-            continue
-        img_tensor_batch = img_tensor.unsqueeze(0)  # Add batch dimension
+    timings = progress_info.timings
 
-        with torch.no_grad():
-            logits = model(img_tensor_batch)
-            pred = (torch.sigmoid(logits) > config.CUTOFF).squeeze().cpu().numpy()
+    # decode and the whiteness check run in loader workers
+    loader = tile_batches(
+        TileDataset(
+            tiles_root,
+            level,
+            tile_keys,
+            input_size,
+            cache is not None,
+            timed=timings.enabled,
+        ),
+        batch_size,
+        num_workers=config.INFERENCE_LOADER_WORKERS,
+        pin_memory=config.PIN_MEMORY,
+    )
+    batches = iter(loader)
+    processed = 0
+    while True:
+        # time spent waiting on the loader workers
+        with timings.span("batch_wait"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        processed += __infer_loaded_batch(
+            model, batch, masks, detections, level, probabilities, cache, timings
+        )
+        __report_progress(progress_info, processed, len(tile_keys))
 
-        # mask_np = __postprocess_mask(pred)
-        mask_np = pred * 255
-        mask_np = mask_np.astype(np.uint8)
-        if __mostly_white(mask_np):
-            progress_info.percent_complete = int(i / len(image_paths) * 100)
-            progress_info.status = str(f"Running inference ({i}/{len(image_paths)})")
-            progress_info.progress_changed.emit()
-            continue
 
-        mask_np = __postprocess_image(mask_np)
+def run_streaming_inference(
+    model,
+    tile_queue: Queue,
+    input_size: tuple[int, int],
+    output_dir: str,
+    progress_info: ProgressInfo,
+    *,
+    batch_size: int | None = None,
+    detections: DetectionWriter | None = None,
+    masks: TileStore | None = None,
+    probabilities: TileStore | None = None,
+    cache: InferenceCache | None = None,
+):
+    # consumes (row, col, RGB array) items until the producer sends None; a
+    # producer that fails sends its exception instead, raised here
+    if batch_size is None:
+        batch_size = config.INFERENCE_BATCH_SIZE
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timings = progress_info.timings
 
-        # Save predicted mask
-        output_path = output_dir.joinpath(f"{img_path.stem}.png").as_posix()
-        mask_img = Image.fromarray((mask_np).astype(np.uint8))
-        mask_img.save(output_path)
-        progress_info.percent_complete = int(i / len(image_paths) * 100)
-        progress_info.status = str(f"Running inference ({i}/{len(image_paths)})")
-        progress_info.progress_changed.emit()
+    inferred = 0
+    done = False
+    while not done:
+        # block for the first tile, then batch whatever is already queued
+        items = [tile_queue.get()]
+        while items[-1] is not None and len(items) < batch_size:
+            try:
+                items.append(tile_queue.get_nowait())
+            except Empty:
+                break
+        if isinstance(items[-1], BaseException):
+            raise items[-1]
+        if items[-1] is None:
+            done = True
+            items.pop()
 
+        # tiles are copied into the batch buffer; a white one's slot is reused
+        img_batch = empty_tile_batch(len(items), input_size)
+        pixels = img_batch.numpy()
+        tile_keys, digests = [], []
+        for row, col, tile in items:
+            slot = pixels[len(tile_keys)]
+            with timings.span("decode_preprocess"):
+                fit_tile_into(tile, slot)
+            with timings.span("whiteness"):
+                white = is_white_tile(slot)
+            if not white:
+                tile_keys.append((row, col))
+                if cache is not None:
+                    digests.append(tile_digest(tile))
+        if tile_keys:
+            __infer_batch(
+                model,
+                tile_keys,
+                img_batch[: len(tile_keys)],
+                masks,
+                detections,
+                probabilities=probabilities,
+                cache=cache,
+                digests=digests,
+                timings=timings,
+            )
+        inferred += len(items)
 
-def infer(
-    input_path: str,
-    output_dir: str,
+    progress_info.status = f"Inference complete ({inferred} tiles)"
+    progress_info.progress_changed.emit()
+
+
+def __init_inference_worker(
+    model_path: str, out_size: tuple[int, int], threads: int, cache_namespace
+) -> None:
+    global _worker_model, _worker_cache
+    torch.set_num_threads(threads)
+    model = None
+    if config.QUANTIZATION:
+        # the parent already built (or rejected) the int8 model
+        model = __quantized_model(Path(model_path), out_size, None)
+    if model is None:
+        model = MODEL_REGISTRY.get(Path(model_path), torch.device("cpu"), out_size)
+    _worker_model = model
+    if cache_namespace is not None:
+        _worker_cache = InferenceCache(
+            config.INFERENCE_CACHE_DIR, config.INFERENCE_CACHE_BYTES, cache_namespace
+        )
+
+
+def __infer_shard(
+    tiles_root: str,
+    level: int,
+    tile_keys: list[tuple[int, int]],
+    input_size: tuple[int, int],
+    detections: bool,
+    merge: bool,
+    save_masks: bool,
+    save_probabilities: bool,
+    timings: StageTimings = NO_TIMINGS,
+) -> ShardResult:
+    # runs in a worker: everything that goes into a per-slide file is handed
+    # back to the parent
+    buffer = None
+    if detections:
+        buffer = DetectionBuffer(LEVEL0_TILE_SCALE, FragmentMerger() if merge else None)
+    masks = TileBuffer() if save_masks else None
+    probabilities = TileBuffer() if save_probabilities else None
+    cache = _worker_cache
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+
+    loader = tile_batches(
+        TileDataset(
+            tiles_root,
+            level,
+            tile_keys,
+            input_size,
+            cache is not None,
+            timed=timings.enabled,
+        ),
+        config.INFERENCE_BATCH_SIZE,
+    )
+    for batch in loader:
+        __infer_loaded_batch(
+            _worker_model,
+            batch,
+            masks,
+            buffer,
+            level,
+            probabilities,
+            cache,
+            timings,
+        )
+
+    return ShardResult(
+        len(tile_keys),
+        buffer.records if buffer is not None else [],
+        buffer.merger if buffer is not None else None,
+        probabilities.tiles if probabilities is not None else [],
+        masks.tiles if masks is not None else [],
+        cache.hits - hits if cache is not None else 0,
+        cache.misses - misses if cache is not None else 0,
+        timings,
+    )
+
+
+def __shard_pool(
+    model_path: str,
+    out_size: tuple[int, int],
+    workers: int,
+    threads: int,
+    cache_namespace: str | None,
+) -> ProcessPoolExecutor:
+    global _shard_pool
+    resolved = Path(model_path).resolve()
+    key = (
+        resolved.as_posix(),
+        resolved.stat().st_mtime_ns,
+        workers,
+        threads,
+        cache_namespace,
+    )
+    with _shard_pool_lock:
+        if _shard_pool is not None:
+            if _shard_pool[0] == key:
+                return _shard_pool[1]
+            # chunks already submitted by other slides still run to the end
+            _shard_pool[1].shutdown(wait=False)
+        # spawn: forking a process that already runs torch threads is unsafe
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=__init_inference_worker,
+            initargs=(str(model_path), out_size, threads, cache_namespace),
+        )
+        _shard_pool = (key, pool)
+        return pool
+
+
+def __drop_shard_pool(pool: ProcessPoolExecutor) -> None:
+    # a pool with a dead worker is broken for good; the next slide starts anew
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is not None and _shard_pool[1] is pool:
+            _shard_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_sharded_inference(
     model_path: str,
+    tiles_root: str,
+    tile_keys: list[tuple[int, int]],
+    input_size: tuple[int, int],
+    output_dir: str,
     progress_info: ProgressInfo,
+    *,
+    workers: int,
+    threads: int,
+    level: int = 0,
+    chunk_size: int | None = None,
+    detections: DetectionWriter | None = None,
+    masks: TileStore | None = None,
+    probabilities: TileStore | None = None,
+    cache: InferenceCache | None = None,
+):
+    """
+    Split the tile list into chunks inferred by `workers` processes with
+    `threads` torch threads each. Results land in the same outputs as
+    run_inference; this process stays the only writer of per-slide files.
+    The worker processes and their models are reused by later slides.
+    """
+    if chunk_size is None:
+        chunk_size = config.INFERENCE_BATCH_SIZE * 4
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    progress_info.status = f"Running inference ({workers} × {threads} threads)"
+    progress_info.progress_changed.emit()
+
+    out_size = (config.INPUT_IMAGE_HEIGHT, config.INPUT_IMAGE_WIDTH)
+    chunks = [
+        tile_keys[i : i + chunk_size] for i in range(0, len(tile_keys), chunk_size)
+    ]
+    pool = __shard_pool(
+        model_path,
+        out_size,
+        workers,
+        threads,
+        cache.namespace if cache is not None else None,
+    )
+    futures = []
+    try:
+        for chunk in chunks:
+            futures.append(
+                pool.submit(
+                    __infer_shard,
+                    str(tiles_root),
+                    level,
+                    chunk,
+                    input_size,
+                    detections is not None,
+                    detections is not None and detections.merger is not None,
+                    masks is not None,
+                    probabilities is not None,
+                    progress_info.timings.child(),
+                )
+            )
+        processed = 0
+        for future in as_completed(futures):
+            result = future.result()
+            for records in result.records:
+                detections.write(records)
+            if result.merger is not None:
+                detections.merger.update(result.merger)
+            for level_idx, row, col, data in result.masks:
+                masks.put(level_idx, row, col, data)
+            for level_idx, row, col, data in result.probabilities:
+                probabilities.put(level_idx, row, col, data)
+            if cache is not None:
+                cache.add_counts(result.cache_hits, result.cache_misses)
+            progress_info.timings.merge(result.timings)
+            processed += result.tiles
+            __report_progress(progress_info, processed, len(tile_keys))
+    except BrokenProcessPool:
+        __drop_shard_pool(pool)
+        raise
+    except BaseException:
+        # chunks of a failed or cancelled slide that have not started yet
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def __time_shard_forward(
+    barrier, batch_size: int, out_size: tuple[int, int], repeats: int
+) -> tuple[int, int]:
+    # runs in a calibration worker; the barrier lines up every worker's
+    # timed forward passes so they contend for memory and caches as they
+    # would during inference
+    example = normalize_batch(
+        torch.randint(0, 256, (batch_size, *out_size, 3), dtype=torch.uint8)
+    )
+    with torch.no_grad():
+        _worker_model(example)  # warm-up at this thread count
+        barrier.wait()
+        start = time.perf_counter_ns()
+        for _ in range(repeats):
+            _worker_model(example)
+        return start, time.perf_counter_ns()
+
+
+def tune_shards(
+    model_path: str | Path,
+    out_size: tuple[int, int],
+    cores: int | None = None,
+    batch_size: int | None = None,
+    repeats: int = 2,
+) -> tuple[int, int]:
+    """
+    Pick the (worker processes, threads per worker) split of the CPU cores
+    with the highest measured tiles/s. For every power-of-two thread count,
+    cores // threads workers are started as for inference and time `repeats`
+    batches each, all at once. The result is cached next to the checkpoint
+    per core count and batch size.
+    """
+    cores = cores or os.cpu_count() or 1
+    if batch_size is None:
+        batch_size = config.INFERENCE_BATCH_SIZE
+    model_path = Path(model_path)
+    result_path = model_path.with_name(
+        f"{model_path.stem}.shards-{cores}c-b{batch_size}.json"
+    )
+    if (
+        result_path.exists()
+        and result_path.stat().st_mtime_ns >= model_path.stat().st_mtime_ns
+    ):
+        result = json.loads(result_path.read_text())
+        # layouts predicted from a single process are measured again
+        if result.get("concurrent"):
+            return result["workers"], result["threads"]
+
+    candidates = sorted({1 << i for i in range(cores.bit_length())} | {cores})
+    candidates = [threads for threads in candidates if threads <= cores]
+    context = multiprocessing.get_context("spawn")
+    tiles_per_second = {}
+    with context.Manager() as manager:
+        for threads in candidates:
+            workers = cores // threads
+            # a worker that never shows up breaks the barrier instead of
+            # hanging the calibration
+            barrier = manager.Barrier(workers, timeout=600)
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=__init_inference_worker,
+                initargs=(str(model_path), out_size, threads, None),
+            ) as pool:
+                spans = list(
+                    pool.map(
+                        __time_shard_forward,
+                        [barrier] * workers,
+                        [batch_size] * workers,
+                        [out_size] * workers,
+                        [repeats] * workers,
+                    )
+                )
+            elapsed = max(end for _, end in spans) - min(start for start, _ in spans)
+            tiles = workers * repeats * batch_size
+            tiles_per_second[threads] = tiles / (elapsed / 1e9)
+
+    threads = max(tiles_per_second, key=tiles_per_second.get)
+    result = {
+        "cores": cores,
+        "batch_size": batch_size,
+        "concurrent": True,
+        "tiles_per_second": tiles_per_second,
+        "workers": cores // threads,
+        "threads": threads,
+    }
+    result_path.write_text(json.dumps(result, indent=2))
+    return result["workers"], result["threads"]
+
+
+def sharding_enabled() -> bool:
+    return config.DEVICE == "cpu" and config.INFERENCE_SHARDS != 1
+
+
+def __shard_layout(model_path: str) -> tuple[int, int]:
+    cores = os.cpu_count() or 1
+    if config.INFERENCE_SHARDS == "auto":
+        out_size = (config.INPUT_IMAGE_HEIGHT, config.INPUT_IMAGE_WIDTH)
+        return tune_shards(model_path, out_size, cores)
+    workers = max(int(config.INFERENCE_SHARDS), 1)
+    threads = config.INFERENCE_SHARD_THREADS or max(cores // workers, 1)
+    return workers, threads
+
+
+def __quantized_model(
+    model_path: Path, out_size: tuple[int, int], svs_path: str | None
+):
+    # the int8 model, or its rejection, is kept in the registry; fp32 weights
+    # are only loaded to build a missing artifact
+    def calibration_tiles():
+        if svs_path is None:
+            return []
+        return read_tissue_tiles(svs_path, config.QUANTIZATION_CALIBRATION_TILES)
+
+    def load(path: Path, device: torch.device, size: tuple[int, int]):
+        return load_quantized(
+            lambda: __load_checkpoint(path, device, size), path, calibration_tiles
+        )
+
+    try:
+        return MODEL_REGISTRY.get(
+            model_path, torch.device("cpu"), out_size, variant="int8", loader=load
+        )
+    except NoCalibrationTiles:
+        return None  # nothing to calibrate with yet; tried again next slide
+
+
+@functools.lru_cache(maxsize=4)
+def __model_digest(model_path: str, mtime_ns: int) -> str:
+    return checkpoint_digest(model_path)
+
+
+def __inference_cache(
+    model_path: str, input_size: tuple[int, int], quantized: bool
+) -> InferenceCache | None:
+    if not config.INFERENCE_CACHE:
+        return None
+    # everything besides the tile that changes the model's output
+    namespace = json.dumps(
+        {
+            "model": __model_digest(model_path, Path(model_path).stat().st_mtime_ns),
+            # uint8 RGB resized (bilinear) to input_size, scaled to [0, 1]
+            "input": list(input_size),
+            "int8": quantized,
+            "bf16": config.INFERENCE_BF16,
+        },
+        sort_keys=True,
+    )
+    return InferenceCache(
+        config.INFERENCE_CACHE_DIR, config.INFERENCE_CACHE_BYTES, namespace
+    )
+
+
+def __report_cache(progress_info: ProgressInfo, cache: InferenceCache | None) -> None:
+    if cache is None:
+        return
+    stats = cache.stats()
+    progress_info.status = (
+        f"Inference cache: {stats['hits']} hits, {stats['misses']} misses"
+    )
+    progress_info.progress_changed.emit()
+
+
+def __detection_writer(
+    output_dir: str, min_radius: int = 15
+) -> DetectionWriter | None:
+    table_path = Path(output_dir) / DETECTIONS_NAME
+    if config.ANNOTATION_OUTPUT == "masks":
+        return None
+    if config.ANNOTATION_OUTPUT != "detections":
+        raise ValueError(f"Unknown annotation output: {config.ANNOTATION_OUTPUT}")
+    merger = FragmentMerger(min_radius) if config.MERGE_BORDER_DETECTIONS else None
+    return DetectionWriter(table_path, LEVEL0_TILE_SCALE, merger)
+
+
+def __mask_writer(output_dir: str) -> PackedTileStore | None:
+    if config.ANNOTATION_OUTPUT != "masks":
+        return None
+    return PackedTileStore(Path(output_dir) / MASK_STORE_NAME, mode="w")
+
+
+def __stale_outputs(output_dir: str) -> list[Path]:
+    # removed only after a successful run, so a failed one keeps the old
+    # results: a detection table would shadow new masks in the viewer, and
+    # older runs saved masks as per-tile PNGs
+    output_dir = Path(output_dir)
+    if config.ANNOTATION_OUTPUT != "masks":
+        return []
+    return [
+        output_dir / DETECTIONS_NAME,
+        output_dir / DETECTION_INDEX_NAME,
+        *output_dir.glob("tile_*.png"),
+    ]
+
+
+def __open_outputs(output_dir: str, cache: InferenceCache | None) -> InferenceOutputs:
+    detections = __detection_writer(output_dir)
+    masks = __mask_writer(output_dir)
+    probabilities = None
+    if config.SAVE_PROBABILITY_MAPS:
+        probabilities = PackedTileStore(
+            Path(output_dir) / PROBABILITY_STORE_NAME, mode="w"
+        )
+    return InferenceOutputs(
+        detections, masks, probabilities, cache, __stale_outputs(output_dir)
+    )
+
+
+def __close_outputs(*outputs) -> None:
+    for output in outputs:
+        if output is not None:
+            output.close()
+
+
+def __discard_outputs(*outputs) -> None:
+    for output in outputs:
+        if output is not None:
+            output.discard()
+
+
+def __remove_stale(stale: list[Path]) -> None:
+    for path in stale:
+        path.unlink(missing_ok=True)
+
+
+def close_inference_outputs(outputs: InferenceOutputs) -> None:
+    """
+    Drop the per-slide output files of a failed or cancelled run; the
+    previous run's outputs stay in place.
+    """
+    __discard_outputs(outputs.detections, outputs.masks, outputs.probabilities)
+
+
+def finish_inference(outputs: InferenceOutputs, progress_info: ProgressInfo) -> None:
+    """
+    Slide-level postprocessing after the last tile: merge detections cut by
+    tile borders, build the spatial index and close the per-slide files.
+    """
+    if outputs.detections is not None and outputs.detections.merger is not None:
+        progress_info.status = "Merging detections across tiles"
+        progress_info.progress_changed.emit()
+    with progress_info.timings.span("finish_outputs"):
+        __close_outputs(outputs.detections, outputs.masks, outputs.probabilities)
+    __remove_stale(outputs.stale)
+    __report_cache(progress_info, outputs.cache)
+
+
+def __prepare_inference(
+    model_path: str, progress_info: ProgressInfo, svs_path: str | None = None
 ):
-    input_image_height = config.INPUT_IMAGE_HEIGHT
-    input_image_width = config.INPUT_IMAGE_WIDTH
+    # tiles get the training preprocessing (Resize + ToTensor), done in
+    # bulk by controller.tile_dataset
+    input_size = (config.INPUT_IMAGE_HEIGHT, config.INPUT_IMAGE_WIDTH)
 
     progress_info.status = "Starting inference"
     progress_info.percent_complete = 0
     progress_info.progress_changed.emit()
 
-    # Define the same preprocessing used in training
-    transform = transforms.Compose(
-        [
-            transforms.Resize((input_image_height, input_image_width)),
-            transforms.ToTensor(),
-        ]
+    # opt-in int8 model, used only where its report clears the Dice bar
+    device = config.DEVICE
+    model = None
+    if config.QUANTIZATION and device == "cpu":
+        progress_info.status = "Preparing quantized model"
+        progress_info.progress_changed.emit()
+        model = __quantized_model(Path(model_path), input_size, svs_path)
+    quantized = model is not None
+    if model is None:
+        model = MODEL_REGISTRY.get(Path(model_path), device, input_size)
+    return model, input_size, __inference_cache(model_path, input_size, quantized)
+
+
+def infer(
+    tiles_root: str,
+    output_dir: str,
+    model_path: str,
+    progress_info: ProgressInfo,
+    *,
+    level: int = 0,
+    svs_path: str | None = None,
+    finalize: bool = True,
+) -> InferenceOutputs | None:
+    """
+    Run inference on a slide's stored tissue tiles. With finalize=False the
+    open outputs are returned for finish_inference() to complete later.
+    """
+    model, input_size, cache = __prepare_inference(
+        model_path, progress_info, svs_path
     )
 
-    device = config.DEVICE
-    model = __load_model(
-        Path(model_path), device, (input_image_height, input_image_width)
+    with open_tile_store(tiles_root) as tile_store:
+        tile_keys = tile_store.keys(level)
+
+    # tiles ruled out by the slide's tissue index are skipped before decoding
+    tissue_index = load_tissue_index(tiles_root)
+    if tissue_index is not None and level in tissue_index:
+        tissue_mask = tissue_index[level]
+        tile_keys = [(row, col) for row, col in tile_keys if tissue_mask[row, col]]
+
+    outputs = __open_outputs(output_dir, cache)
+    detections, masks, probabilities = outputs[:3]
+    try:
+        if sharding_enabled():
+            progress_info.status = "Planning inference workers"
+            progress_info.progress_changed.emit()
+            workers, threads = __shard_layout(model_path)
+            run_sharded_inference(
+                model_path,
+                tiles_root,
+                tile_keys,
+                input_size,
+                output_dir,
+                progress_info,
+                workers=workers,
+                threads=threads,
+                level=level,
+                detections=detections,
+                masks=masks,
+                probabilities=probabilities,
+                cache=cache,
+            )
+        else:
+            run_inference(
+                model,
+                tiles_root,
+                tile_keys,
+                input_size,
+                output_dir,
+                progress_info,
+                level=level,
+                detections=detections,
+                masks=masks,
+                probabilities=probabilities,
+                cache=cache,
+            )
+    except BaseException:
+        close_inference_outputs(outputs)
+        raise
+    if not finalize:
+        return outputs
+    finish_inference(outputs, progress_info)
+
+
+def infer_stream(
+    tile_queue: Queue,
+    output_dir: str,
+    model_path: str,
+    progress_info: ProgressInfo,
+    *,
+    svs_path: str | None = None,
+    finalize: bool = True,
+) -> InferenceOutputs | None:
+    model, input_size, cache = __prepare_inference(
+        model_path, progress_info, svs_path
     )
-    image_paths = __get_image_paths(Path(input_path))
-    run_inference(model, image_paths, transform, output_dir, progress_info)
+    outputs = __open_outputs(output_dir, cache)
+    try:
+        run_streaming_inference(
+            model,
+            tile_queue,
+            input_size,
+            output_dir,
+            progress_info,
+            detections=outputs.detections,
+            masks=outputs.masks,
+            probabilities=outputs.probabilities,
+            cache=cache,
+        )
+    except BaseException:
+        close_inference_outputs(outputs)
+        raise
+    if not finalize:
+        return outputs
+    finish_inference(outputs, progress_info)
+
+
+def repostprocess(
+    output_dir: str,
+    progress_info: ProgressInfo,
+    *,
+    cutoff: float | None = None,
+    looseness: int = 30,
+    min_radius: int = 15,
+) -> None:
+    """
+    Regenerate a slide's detections (or masks) with new postprocessing
+    parameters from the probability maps that inference saved with
+    config.SAVE_PROBABILITY_MAPS, without running the model.
+    """
+    output_dir = Path(output_dir)
+    store_path = output_dir / PROBABILITY_STORE_NAME
+    if not store_path.exists():
+        raise FileNotFoundError(f"No saved probability maps in {output_dir}")
+
+    with PackedTileStore(store_path) as probabilities:
+        detections = __detection_writer(output_dir, min_radius)
+        masks = __mask_writer(output_dir)
+        stale = __stale_outputs(output_dir)
+        try:
+            for level in probabilities.levels():
+                tile_keys = probabilities.keys(level)
+                total = len(tile_keys)
+                records = []
+                for i, (row, col) in enumerate(tile_keys, 1):
+                    prob = __decode_probability(probabilities.get(level, row, col))
+                    tile_records = __postprocess_tile(
+                        prob,
+                        row,
+                        col,
+                        level,
+                        masks,
+                        detections,
+                        cutoff=cutoff,
+                        looseness=looseness,
+                        min_radius=min_radius,
+                    )
+                    if tile_records is not None:
+                        records.append(tile_records)
+                    if i % 64 == 0 or i == total:
+                        progress_info.percent_complete = int(i / total * 100)
+                        progress_info.status = f"Re-postprocessing ({i}/{total})"
+                        progress_info.progress_changed.emit()
+                if records:
+                    detections.write(np.concatenate(records))
+        except BaseException:
+            __discard_outputs(detections, masks)
+            raise
+        __close_outputs(detections, masks)
+        __remove_stale(stale)
@@ -0,0 +1,159 @@
+import threading
+import warnings
+from pathlib import Path
+
+import numpy as np
+import torch
+
+import config
+
+BACKENDS = ("eager", "torchscript", "compile", "onnx")
+
+
+class OnnxModel:
+    """Runs an exported ONNX graph with onnxruntime behind a torch-like call."""
+
+    def __init__(self, onnx_path: Path, device):
+        import onnxruntime
+
+        self.device = device
+        self.session = onnxruntime.InferenceSession(
+            onnx_path.as_posix(), providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        x = np.ascontiguousarray(x.detach().cpu().float().numpy())
+        logits = self.session.run(None, {self.input_name: x})[0]
+        return torch.from_numpy(logits).to(self.device)
+
+    def eval(self):
+        return self
+
+
+def __artifact_path(model_path: Path, out_size: tuple[int, int], suffix: str) -> Path:
+    # exported graphs live next to the checkpoint they were built from, named
+    # after the preparation settings baked into them
+    h, w = out_size
+    layout = "cl" if config.CHANNELS_LAST else "nchw"
+    precision = "bf16" if config.INFERENCE_BF16 else "fp32"
+    prep = f"{layout}-{precision}-fuse{config.FUSION_TOLERANCE:g}"
+    return model_path.with_name(f"{model_path.stem}.{h}x{w}.{prep}.{suffix}")
+
+
+def __is_fresh(artifact: Path, model_path: Path) -> bool:
+    if not artifact.exists():
+        return False
+    return artifact.stat().st_mtime_ns >= model_path.stat().st_mtime_ns
+
+
+def __torchscript(model, model_path: Path, device, example: torch.Tensor):
+    artifact = __artifact_path(model_path, example.shape[-2:], "torchscript.pt")
+    if __is_fresh(artifact, model_path):
+        return torch.jit.load(artifact.as_posix(), map_location=device)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    torch.jit.save(traced, artifact.as_posix())
+    return traced
+
+
+def __onnx(model, model_path: Path, device, example: torch.Tensor):
+    artifact = __artifact_path(model_path, example.shape[-2:], "onnx")
+    if not __is_fresh(artifact, model_path):
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                example,
+                artifact.as_posix(),
+                input_names=["input"],
+                output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=17,
+            )
+    return OnnxModel(artifact, device)
+
+
+def _masks_agree(expected_logits: torch.Tensor, actual_logits: torch.Tensor) -> bool:
+    expected = torch.sigmoid(expected_logits) > config.CUTOFF
+    actual = torch.sigmoid(actual_logits) > config.CUTOFF
+    agreement = (expected == actual).float().mean().item()
+    return agreement >= 1.0 - config.BACKEND_PARITY_TOLERANCE
+
+
+class ParityCheckedModel:
+    """
+    Runs the eager model until the fast backend has produced the same masks
+    on the first real batch, then hands over to the backend. A backend that
+    disagrees or fails on that batch is dropped for good.
+    """
+
+    def __init__(self, model, candidate, backend: str):
+        self.model = model
+        self.candidate = candidate
+        self.backend = backend
+        self.active = None  # decided on the first real batch
+        self._lock = threading.Lock()
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        if self.active is not None:
+            return self.active(x)
+        if x.numel() == 0 or bool(x.amin() == x.amax()):
+            # a constant (warm-up) batch says nothing about the masks
+            return self.model(x)
+        with self._lock:
+            if self.active is not None:
+                return self.active(x)
+            expected = self.model(x)
+            try:
+                agree = _masks_agree(expected, self.candidate(x))
+                if not agree:
+                    warnings.warn(
+                        f"{self.backend} masks differ from eager; using eager model"
+                    )
+            except Exception as exc:
+                agree = False
+                warnings.warn(
+                    f"{self.backend} backend failed ({exc}); using eager model"
+                )
+            self.active = self.candidate if agree else self.model
+            return expected
+
+    def eval(self):
+        return self
+
+
+def prepare_backend(
+    model,
+    model_path: str | Path,
+    device,
+    out_size: tuple[int, int],
+    backend: str | None = None,
+):
+    """
+    Wrap an eval-mode model in the requested inference backend. The backend
+    only takes over once its masks match the eager model's on the first real
+    batch of tiles (see ParityCheckedModel); if it cannot be built, or
+    disagrees, the eager model is used.
+    """
+    if backend is None:
+        backend = config.INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == "eager":
+        return model
+
+    model_path = Path(model_path)
+    # tracing/export input only; parity is checked on real tiles
+    generator = torch.Generator().manual_seed(0)
+    example = torch.rand((2, 3, *out_size), generator=generator).to(device)
+    try:
+        if backend == "torchscript":
+            candidate = __torchscript(model, model_path, device, example)
+        elif backend == "compile":
+            candidate = torch.compile(model)
+        else:
+            candidate = __onnx(model, model_path, device, example)
+    except Exception as exc:
+        warnings.warn(f"{backend} backend unavailable ({exc}); using eager model")
+        return model
+    return ParityCheckedModel(model, candidate, backend)
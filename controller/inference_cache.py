@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# put() writes an entry within moments; temp files this old were left behind
+# by an interrupted process rather than being written by a live one
+_STALE_TEMP_SECONDS = 3600
+
+
+def tile_digest(tile: np.ndarray) -> str:
+    """Content digest of a decoded RGB tile (independent of how it was stored)."""
+    tile = np.ascontiguousarray(tile)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(tile.shape).encode("ascii"))
+    digest.update(tile.data)
+    return digest.hexdigest()
+
+
+class _EntryIndex:
+    """Sizes and recency order of the entries in one cache directory."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        # recency order survives restarts through file modification times
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        stale_before = time.time() - _STALE_TEMP_SECONDS
+        for path in self.root.glob("??/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # replaced or evicted by another process
+                continue
+            if path.suffix == ".tmp":
+                if stat.st_mtime < stale_before:
+                    path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime_ns, path.name, stat.st_size))
+        self.entries: OrderedDict[str, int] = OrderedDict(
+            (name, size) for _, name, size in sorted(entries)
+        )
+        self.size = sum(self.entries.values())
+
+
+# Scanning a cache directory stats every entry, so it happens once per
+# process and directory; every InferenceCache over it shares the index
+_indexes: dict[str, _EntryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _entry_index(root: Path, max_bytes: int) -> _EntryIndex:
+    name = root.resolve().as_posix()
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            index = _indexes[name] = _EntryIndex(root, max_bytes)
+        index.max_bytes = max_bytes
+        return index
+
+
+class InferenceCache:
+    """
+    On-disk, content-addressed cache of per-tile model outputs.
+
+    Entries are keyed by (tile digest, namespace), where the namespace
+    identifies the model checkpoint and everything else that changes its
+    output for a tile (input size, preprocessing, precision). Files live
+    under `root/<2 hex>/<key>`; once the total size passes `max_bytes` the
+    least recently used entries are deleted. The directory is scanned once
+    per process, so a handle is cheap to create, e.g. per slide; hits and
+    misses are counted per handle.
+    """
+
+    def __init__(self, root: str | os.PathLike, max_bytes: int, namespace: str):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._index = _entry_index(self.root, max_bytes)
+
+    def _key(self, digest: str) -> str:
+        return hashlib.blake2b(
+            f"{self.namespace}:{digest}".encode("ascii"), digest_size=20
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, digest: str) -> bytes | None:
+        key = self._key(digest)
+        index = self._index
+        path = self._path(key)
+        try:
+            # entries missing from the index may have been written by
+            # another process since the scan
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:  # never stored, or evicted
+            with index.lock:
+                index.size -= index.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with index.lock:
+            index.size += len(data) - index.entries.pop(key, 0)
+            index.entries[key] = len(data)
+            self.hits += 1
+        return data
+
+    def put(self, digest: str, data: bytes) -> None:
+        key = self._key(digest)
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)  # readers never see a partial entry
+
+        index = self._index
+        with index.lock:
+            index.size += len(data) - index.entries.pop(key, 0)
+            index.entries[key] = len(data)
+            while index.size > index.max_bytes and len(index.entries) > 1:
+                old_key, old_size = index.entries.popitem(last=False)
+                index.size -= old_size
+                self._path(old_key).unlink(missing_ok=True)
+
+    def add_counts(self, hits: int, misses: int) -> None:
+        """Fold in lookups made through another handle (e.g. a worker's)."""
+        with self._index.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> dict:
+        with self._index.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index.entries),
+                "bytes": self._index.size,
+            }
@@ -0,0 +1,65 @@
+import os
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from controller.tile_store import PackedTileStore
+
+MASK_STORE_NAME = "masks.pack"
+
+# Per tile: height, width, then the deflated uint32 run lengths
+_HEADER = struct.Struct("<HH")
+
+
+def encode_mask(foreground: np.ndarray) -> bytes:
+    """
+    Run-length encode a binary (height, width) mask tile. Runs follow the
+    pixels in row-major order and alternate background and foreground,
+    starting with background (a zero-length run when the tile starts on
+    foreground).
+    """
+    height, width = foreground.shape
+    flat = np.ascontiguousarray(foreground, dtype=bool).ravel()
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs))
+    return _HEADER.pack(height, width) + zlib.compress(
+        runs.astype("<u4").tobytes(), 1
+    )
+
+
+def __mask_runs(data: bytes) -> tuple[tuple[int, int], np.ndarray]:
+    height, width = _HEADER.unpack_from(data)
+    runs = np.frombuffer(zlib.decompress(data[_HEADER.size :]), dtype="<u4")
+    if int(runs.sum()) != height * width:
+        raise ValueError("Corrupt mask tile")
+    return (height, width), runs
+
+
+def decode_mask(data: bytes) -> np.ndarray:
+    """The encoded tile as a boolean (height, width) foreground mask."""
+    shape, runs = __mask_runs(data)
+    values = np.zeros(len(runs), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, runs).reshape(shape)
+
+
+def mask_overlay(data: bytes, argb: int) -> np.ndarray:
+    """
+    The encoded tile as (height, width) uint32 ARGB32 pixels, `argb` on the
+    foreground and fully transparent elsewhere. The runs expand straight
+    into pixels, without going through an image codec.
+    """
+    shape, runs = __mask_runs(data)
+    colors = np.zeros(len(runs), dtype=np.uint32)
+    colors[1::2] = argb
+    return np.repeat(colors, runs).reshape(shape)
+
+
+def load_mask_store(inference_root: str | os.PathLike) -> PackedTileStore | None:
+    """Open the mask tiles of an inference output directory, None if absent."""
+    path = Path(inference_root) / MASK_STORE_NAME
+    return PackedTileStore(path) if path.exists() else None
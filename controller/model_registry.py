@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import torch
+
+ModelLoader = Callable[[Path, torch.device, tuple[int, int]], torch.nn.Module]
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded, eval-mode models.
+
+    Models are keyed by checkpoint path and modification time, so a replaced
+    checkpoint is reloaded. A `variant` (e.g. "int8") with its own `loader`
+    is cached beside the plain model; whatever it returns is kept, None
+    included, while a loader that raises leaves nothing behind. At most
+    `max_models` stay resident; the least recently used one is evicted first.
+    """
+
+    def __init__(self, loader: ModelLoader, max_models: int = 2):
+        self.loader = loader
+        self.max_models = max_models
+        self._models: OrderedDict[tuple, torch.nn.Module] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(
+        model_path: Path, device, out_size: tuple[int, int], variant: str
+    ) -> tuple:
+        model_path = model_path.resolve()
+        return (
+            model_path.as_posix(),
+            model_path.stat().st_mtime_ns,
+            str(device),
+            tuple(out_size),
+            variant,
+        )
+
+    def get(
+        self,
+        model_path: str | Path,
+        device,
+        out_size: tuple[int, int],
+        *,
+        variant: str = "",
+        loader: ModelLoader | None = None,
+    ) -> torch.nn.Module | None:
+        model_path = Path(model_path)
+        key = self._key(model_path, device, out_size, variant)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            # an older version of the same checkpoint is stale
+            for stale in [k for k in self._models if k[0] == key[0] and k[1] != key[1]]:
+                del self._models[stale]
+
+            model = (loader or self.loader)(model_path, device, out_size)
+            self._models[key] = model
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+    def warm_up(
+        self, model_path: str | Path, device, out_size: tuple[int, int]
+    ) -> threading.Thread:
+        """Load the model and run one dummy forward pass in the background."""
+
+        def run():
+            model = self.get(model_path, device, out_size)
+            with torch.no_grad():
+                model(torch.zeros((1, 3, *out_size), device=device))
+
+        thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def evict(self, model_path: str | Path | None = None) -> None:
+        """Drop one checkpoint's models, or every model when no path is given."""
+        with self._lock:
+            if model_path is None:
+                self._models.clear()
+                return
+            path = Path(model_path).resolve().as_posix()
+            for key in [k for k in self._models if k[0] == path]:
+                del self._models[key]
+
+    def __len__(self) -> int:
+        return len(self._models)
@@ -0,0 +1,48 @@
+import threading
+from typing import Callable
+
+from controller.timing import StageTimings
+
+
+class ProgressSignal:
+    """
+    Callback list with the connect()/emit() surface of a Qt Signal, so the
+    processing pipeline does not depend on Qt. Callbacks run synchronously
+    in the emitting (worker) thread; GUI code must hand them over to its
+    own thread (see view.widgets.progress_item).
+    """
+
+    def __init__(self):
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def connect(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def disconnect(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            self._callbacks.remove(callback)
+
+    def emit(self) -> None:
+        # every callback runs; the first exception is re-raised afterwards
+        with self._lock:
+            callbacks = list(self._callbacks)
+        error = None
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            raise error
+
+
+class ProgressInfo:
+    def __init__(self, name: str, image=None):
+        self.name: str = name
+        self.image = image  # model.project.image.ImageObject in the GUI
+        self.status: str = "Queued"
+        self.percent_complete: int = 0
+        self.progress_changed = ProgressSignal()
+        self.timings = StageTimings(name)
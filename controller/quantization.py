@@ -0,0 +1,117 @@
+import copy
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import torch
+
+import config
+from controller.tile_dataset import normalize_batch
+
+
+class NoCalibrationTiles(ValueError):
+    pass
+
+
+def checkpoint_digest(model_path: str | Path) -> str:
+    sha = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def __to_batch(tiles: list[np.ndarray]) -> torch.Tensor:
+    # same input as inference gets
+    return normalize_batch(torch.from_numpy(np.stack(tiles)))
+
+
+def quantize_static(model: torch.nn.Module, calibration: torch.Tensor):
+    """Post-training static int8 quantization (FX graph mode, x86 backend)."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    model = copy.deepcopy(model).cpu().eval()
+    prepared = prepare_fx(
+        model,
+        get_default_qconfig_mapping("x86"),
+        example_inputs=(calibration[:1],),
+    )
+    with torch.no_grad():
+        for batch in calibration.split(config.INFERENCE_BATCH_SIZE):
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def __dice(a: np.ndarray, b: np.ndarray) -> float:
+    total = a.sum() + b.sum()
+    return 1.0 if total == 0 else float(2 * np.logical_and(a, b).sum() / total)
+
+
+def quantization_report(fp32_model, int8_model, tiles: torch.Tensor) -> dict:
+    """Speed-up and per-tile mask Dice agreement of int8 against fp32."""
+    timings, masks = {}, {}
+    with torch.no_grad():
+        for name, model in (("fp32", fp32_model), ("int8", int8_model)):
+            model(tiles[:1])  # exclude one-off initialisation from the timing
+            start = time.perf_counter()
+            logits = torch.cat(
+                [model(b) for b in tiles.split(config.INFERENCE_BATCH_SIZE)]
+            )
+            timings[name] = time.perf_counter() - start
+            masks[name] = (torch.sigmoid(logits) > config.CUTOFF).numpy()
+
+    dices = [__dice(a, b) for a, b in zip(masks["fp32"], masks["int8"])]
+    return {
+        "tiles": len(tiles),
+        "fp32_seconds": timings["fp32"],
+        "int8_seconds": timings["int8"],
+        "speedup": timings["fp32"] / timings["int8"],
+        "dice_mean": float(np.mean(dices)),
+        "dice_min": float(np.min(dices)),
+    }
+
+
+def load_quantized(
+    load_fp32: Callable[[], torch.nn.Module],
+    model_path: str | Path,
+    calibration_tiles,
+) -> torch.nn.Module | None:
+    """
+    Return the int8 model for a checkpoint, building it on first use.
+
+    Quantized models are cached next to the checkpoint as TorchScript keyed by
+    the checkpoint's SHA-256, with a JSON report beside them. The int8 model
+    is only returned while its report's mean Dice against fp32 is at least
+    config.QUANTIZATION_MIN_DICE; otherwise None (keep using fp32).
+    `load_fp32` and `calibration_tiles` (RGB tiles) are only called when the
+    cache is cold; without enough tiles to build it, NoCalibrationTiles is
+    raised.
+    """
+    model_path = Path(model_path)
+    stem = f"{model_path.stem}.{checkpoint_digest(model_path)[:16]}.int8"
+    artifact = model_path.with_name(f"{stem}.pt")
+    report_path = model_path.with_name(f"{stem}.json")
+
+    if not (artifact.exists() and report_path.exists()):
+        tiles = calibration_tiles()
+        if len(tiles) < 2:
+            raise NoCalibrationTiles("Not enough tiles to calibrate the int8 model")
+        # half the tiles calibrate the observers, the other half evaluate
+        fp32_model = load_fp32()
+        batch = __to_batch(tiles)
+        int8_model = quantize_static(fp32_model, batch[::2])
+        report = quantization_report(fp32_model, int8_model, batch[1::2])
+        report["checkpoint"] = model_path.as_posix()
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(int8_model, batch[:1]))
+        torch.jit.save(traced, artifact.as_posix())
+        report_path.write_text(json.dumps(report, indent=2))
+
+    report = json.loads(report_path.read_text())
+    if report["dice_mean"] < config.QUANTIZATION_MIN_DICE:
+        return None
+    return torch.jit.load(artifact.as_posix(), map_location="cpu")
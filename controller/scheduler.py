@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Callable
+
+from controller.progress import ProgressInfo
+
+Stage = tuple[str, Callable[["Job"], None]]
+# Stages that run at the same time, each under its own stage's limit
+StageGroup = tuple[Stage, ...]
+
+
+def _group(entry: Stage | StageGroup) -> StageGroup:
+    return (entry,) if isinstance(entry[0], str) else entry
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    A slide's trip through the pipeline: an ordered list of (stage name,
+    callable) pairs run one after another, each on a worker from its stage's
+    queue. An entry can also be a group of such pairs that run concurrently
+    (e.g. a producer and its consumer); members after the first are only
+    queued once the first has started, and the job moves on when all of them
+    are done. Stages share `state`; `cleanups` run if the job fails or is
+    cancelled before its last stage completes.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(
+        self,
+        name: str,
+        stages: list[Stage | StageGroup],
+        *,
+        priority: int = 0,
+        progress_info: ProgressInfo | None = None,
+    ):
+        self.id = next(self._ids)
+        self.name = name
+        self.stages = stages
+        self.priority = priority
+        self.progress_info = progress_info
+        self.state: dict = {}
+        self.cleanups: list[Callable[[], None]] = []
+        self.stage_seconds: dict[str, float] = {}
+        self.queued_seconds: float = 0.0
+        self.future: Future = Future()
+        self._next_stage = 0
+        self._running_members = 0
+        self._errors: list[BaseException] = []
+        self._cancelled = threading.Event()
+        self._queued_at = 0.0
+
+        if progress_info is not None:
+            # running stages report progress often; that is where they stop
+            progress_info.progress_changed.connect(self.raise_if_cancelled)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Drop the job from its queue, or stop it at its next progress update."""
+        self._cancelled.set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(f"{self.name} was cancelled")
+
+    def result(self, timeout: float | None = None):
+        return self.future.result(timeout)
+
+    def add_done_callback(self, fn: Callable[["Job"], None]) -> None:
+        self.future.add_done_callback(lambda _: fn(self))
+
+
+class JobScheduler:
+    """
+    Pipelines jobs through per-stage queues, each with its own concurrency
+    limit, on a fixed pool of worker threads (one per concurrency slot), so
+    e.g. one slide's I/O-bound tiling overlaps another's inference. Within a
+    stage, higher priority jobs go first, then earlier submitted ones.
+    """
+
+    def __init__(self, limits: dict[str, int]):
+        self.limits = dict(limits)
+        self._queues: dict[str, list] = {stage: [] for stage in limits}
+        self._running = {stage: 0 for stage in limits}
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(sum(self.limits.values()))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, job: Job) -> Job:
+        for entry in job.stages:
+            for stage, _ in _group(entry):
+                if stage not in self.limits:
+                    raise ValueError(f"Unknown pipeline stage: {stage}")
+        self._enqueue(job)
+        return job
+
+    def cancel(self, job: Job) -> None:
+        job.cancel()
+        with self._condition:
+            self._condition.notify_all()
+
+    def pending(self) -> dict[str, int]:
+        with self._condition:
+            return {stage: len(queue) for stage, queue in self._queues.items()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    @staticmethod
+    def _members(job: Job) -> StageGroup:
+        return _group(job.stages[job._next_stage])
+
+    def _push(self, job: Job, member: int) -> None:
+        # called with the condition held
+        stage = self._members(job)[member][0]
+        heapq.heappush(self._queues[stage], (-job.priority, job.id, member, job))
+        self._condition.notify_all()
+
+    def _enqueue(self, job: Job) -> None:
+        members = self._members(job)
+        job._queued_at = time.perf_counter()
+        job._running_members = len(members)
+        self._set_status(job, f"Waiting for {members[0][0]}")
+        with self._condition:
+            self._push(job, 0)
+
+    def _take(self) -> tuple[str, Job, int] | None:
+        # called with the condition held: the best job of any stage with room
+        best = None
+        for stage, queue in self._queues.items():
+            if queue and self._running[stage] < self.limits[stage]:
+                if best is None or queue[0][:2] < self._queues[best][0][:2]:
+                    best = stage
+        if best is None:
+            return None
+        _, _, member, job = heapq.heappop(self._queues[best])
+        self._running[best] += 1
+        if member == 0:
+            # the rest of a group only competes for slots once its first
+            # member runs, so a consumer never holds a slot its producer
+            # is still waiting behind
+            for other in range(1, len(self._members(job))):
+                self._push(job, other)
+        return best, job, member
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                taken = self._take()
+                while taken is None:
+                    if self._shutdown:
+                        return
+                    self._condition.wait()
+                    taken = self._take()
+            stage, job, member = taken
+            try:
+                self._run_stage(stage, job, member)
+            finally:
+                with self._condition:
+                    self._running[stage] -= 1
+                    self._condition.notify_all()
+
+    def _run_stage(self, stage: str, job: Job, member: int) -> None:
+        _, fn = self._members(job)[member]
+        start = time.perf_counter()
+        if member == 0:
+            job.queued_seconds += start - job._queued_at
+        try:
+            job.raise_if_cancelled()
+            fn(job)
+        except BaseException as exc:
+            if not isinstance(exc, JobCancelled):
+                traceback.print_exc()
+            job._errors.append(exc)
+        finally:
+            job.stage_seconds[stage] = time.perf_counter() - start
+
+        with self._condition:
+            job._running_members -= 1
+            if job._running_members > 0:
+                return  # the last member of a group moves the job on
+        if job._errors:
+            self._finish(job, job._errors[0])
+            return
+
+        job._next_stage += 1
+        if job._next_stage < len(job.stages):
+            self._enqueue(job)
+        else:
+            self._finish(job, None)
+
+    def _finish(self, job: Job, exc: BaseException | None) -> None:
+        if exc is not None:
+            for cleanup in job.cleanups:
+                try:
+                    cleanup()
+                except Exception:
+                    traceback.print_exc()
+            self._set_status(
+                job, "Cancelled" if isinstance(exc, JobCancelled) else f"Failed: {exc}"
+            )
+            job.future.set_exception(exc)
+        else:
+            job.future.set_result(job.state.get("result"))
+
+    @staticmethod
+    def _set_status(job: Job, status: str) -> None:
+        info = job.progress_info
+        if info is None:
+            return
+        info.status = status
+        try:
+            info.progress_changed.emit()
+        except JobCancelled:
+            pass  # picked up when the job reaches a worker
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import BatchSampler, DataLoader, Dataset, get_worker_info
+
+from controller.inference_cache import tile_digest
+from controller.tile_store import TileStore, open_tile_store
+
+
+def is_white_tile(rgb: np.ndarray) -> bool:
+    """
+    The background check inference has always applied, on uint8 HWC pixels:
+    run on CHW ToTensor() output, __mostly_white treated every (channel, row)
+    line as one sample, white only when all of it is past 235/255.
+    """
+    lines = cv2.reduce(rgb, 1, cv2.REDUCE_MIN) > 235  # (row, 1, channel)
+    return bool(lines.mean() >= 0.97)
+
+
+def empty_tile_batch(count: int, size: tuple[int, int]) -> torch.Tensor:
+    """uint8 NHWC buffer for `count` RGB tiles of `size` (height, width)."""
+    batch = torch.empty((count, *size, 3), dtype=torch.uint8)
+    if get_worker_info() is not None:
+        # a DataLoader worker hands the batch over without another copy
+        batch.share_memory_()
+    return batch
+
+
+def fit_tile_into(rgb: np.ndarray, out: np.ndarray) -> None:
+    """Copy an RGB tile into a batch slot, resizing only if sizes differ."""
+    height, width = out.shape[:2]
+    if rgb.shape[:2] != (height, width):
+        # what transforms.Resize does to a PIL image
+        rgb = np.asarray(
+            Image.fromarray(rgb).resize((width, height), Image.Resampling.BILINEAR)
+        )
+    np.copyto(out, rgb)
+
+
+def decode_tile_into(data: bytes, out: np.ndarray) -> np.ndarray:
+    """
+    Decode an encoded tile into a uint8 RGB batch slot and return the
+    decoded pixels (`out` itself unless the tile had to be resized).
+    """
+    bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError("Tile could not be decoded")
+    if bgr.shape[:2] == out.shape[:2]:
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=out)
+        return out
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    fit_tile_into(rgb, out)
+    return rgb
+
+
+def normalize_batch(batch: torch.Tensor) -> torch.Tensor:
+    """
+    uint8 NHWC tiles to float NCHW model input in [0, 1], exactly as
+    transforms.ToTensor() would, in one pass over the batch. The result keeps
+    the NHWC memory layout, i.e. it is already channels_last.
+    """
+    return batch.permute(0, 3, 1, 2).float().div_(255)
+
+
+class TileDataset(Dataset):
+    """
+    Tiles of one pyramid level read from a slide's tile store, indexed by
+    lists of positions: each item is a whole batch (see tile_batches).
+
+    Batches are (rows, cols, uint8 NHWC tiles, mostly white flags, content
+    digests, timings). Tiles are decoded straight into the batch buffer and
+    only resized when they are not `size`; the whiteness check runs on the
+    uint8 pixels and float conversion is left to normalize_batch(). Digests
+    (see controller.inference_cache) are only computed with `digests=True`
+    and are "" otherwise. With `timed=True`, every tile's timing row is
+    (pid, tid, start, decoded, whiteness checked) in perf_counter_ns, for
+    the parent's StageTimings; otherwise zeros. The store is opened lazily
+    so every DataLoader worker gets its own handle/mmap.
+    """
+
+    def __init__(
+        self,
+        tiles_root: str | os.PathLike,
+        level: int,
+        tile_keys: list[tuple[int, int]],
+        size: tuple[int, int],
+        digests: bool = False,
+        timed: bool = False,
+    ):
+        self.tiles_root = tiles_root
+        self.level = level
+        self.tile_keys = tile_keys
+        self.size = size
+        self.digests = digests
+        self.timed = timed
+        self._store: TileStore | None = None
+
+    def __len__(self) -> int:
+        return len(self.tile_keys)
+
+    def __getitem__(self, indices: list[int]):
+        if self._store is None:
+            self._store = open_tile_store(self.tiles_root)
+        count = len(indices)
+        keys = np.array([self.tile_keys[i] for i in indices], dtype=np.int64)
+        keys = keys.reshape(count, 2)
+        images = empty_tile_batch(count, self.size)
+        pixels = images.numpy()
+        white = np.zeros(count, dtype=bool)
+        digests = [""] * count
+        timing = np.zeros((count, 5), dtype=np.int64)
+
+        for i, (row, col) in enumerate(keys.tolist()):
+            start = time.perf_counter_ns() if self.timed else 0
+            data = self._store.get(self.level, row, col)
+            decoded = decode_tile_into(data, pixels[i])
+            if self.digests:
+                digests[i] = tile_digest(decoded)
+            decoded_at = time.perf_counter_ns() if self.timed else 0
+            white[i] = is_white_tile(pixels[i])
+            if self.timed:
+                timing[i] = (
+                    os.getpid(),
+                    threading.get_native_id(),
+                    start,
+                    decoded_at,
+                    time.perf_counter_ns(),
+                )
+        return keys[:, 0], keys[:, 1], images, white, digests, timing
+
+    def __getstate__(self):
+        # store handles (open files, mmaps) are per process
+        state = self.__dict__.copy()
+        state["_store"] = None
+        return state
+
+
+def tile_batches(
+    dataset: TileDataset, batch_size: int, num_workers: int = 0, **loader_kwargs
+) -> DataLoader:
+    """
+    DataLoader yielding TileDataset batches, built whole in the workers.
+    Workers are spawned, not forked: the caller is the GUI or a scheduler
+    thread, and a fork would copy its Qt and lock state mid-flight.
+    """
+    sampler = BatchSampler(range(len(dataset)), batch_size, drop_last=False)
+    if num_workers > 0:
+        loader_kwargs.setdefault("multiprocessing_context", "spawn")
+        loader_kwargs.setdefault("persistent_workers", True)
+    return DataLoader(
+        dataset,
+        batch_size=None,
+        sampler=sampler,
+        num_workers=num_workers,
+        **loader_kwargs,
+    )
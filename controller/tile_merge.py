@@ -0,0 +1,164 @@
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from controller.detections import DETECTION_DTYPE
+
+SIDES = ("top", "bottom", "left", "right")
+
+
+class Fragment(NamedTuple):
+    hull: np.ndarray  # (k, 2) int32 convex hull in level-grid tile pixels
+    weight: float  # summed foreground probability
+    area: int  # pixels
+
+
+class TileFragments(NamedTuple):
+    fragments: dict[int, Fragment]  # by component label
+    edges: dict[str, np.ndarray]  # side -> (n, 3) runs of start, stop, label
+
+
+class DisjointSet:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]  # path halving
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> None:
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def edge_runs(edge: np.ndarray) -> np.ndarray:
+    """Runs of equal non-zero labels along an edge: start, stop (inclusive), label."""
+    change = np.flatnonzero(np.diff(edge)) + 1
+    starts = np.r_[0, change]
+    stops = np.r_[change, len(edge)] - 1
+    labels = edge[starts]
+    keep = labels > 0
+    return np.column_stack((starts[keep], stops[keep], labels[keep])).astype(np.int32)
+
+
+def tile_fragments(
+    labels: np.ndarray,
+    stats: np.ndarray,
+    origin: tuple[int, int],
+    foreground_prob: np.ndarray | None = None,
+) -> TileFragments:
+    """
+    Record the components of a labelled tile that touch its border. `origin`
+    is the tile's top-left corner on the level's pixel grid (col * width,
+    row * height), so hulls from neighbouring tiles share one frame.
+    """
+    edges = {
+        "top": labels[0],
+        "bottom": labels[-1],
+        "left": labels[:, 0],
+        "right": labels[:, -1],
+    }
+    border = np.unique(np.concatenate(list(edges.values())))
+
+    fragments = {}
+    for i in border[border > 0].tolist():
+        left, top, width, height, area = stats[i]
+        component = labels[top : top + height, left : left + width] == i
+        rows, cols = np.nonzero(component)
+        points = np.column_stack(
+            (cols + left + origin[0], rows + top + origin[1])
+        ).astype(np.int32)
+        if foreground_prob is None:
+            weight = float(area)
+        else:
+            window = foreground_prob[top : top + height, left : left + width]
+            weight = float(window[component].sum())
+        fragments[i] = Fragment(cv2.convexHull(points).reshape(-1, 2), weight, area)
+
+    return TileFragments(fragments, {side: edge_runs(e) for side, e in edges.items()})
+
+
+def touching_runs(a: np.ndarray, b: np.ndarray) -> list[tuple[int, int]]:
+    """Label pairs of runs on the two faces of a shared edge that 8-connect."""
+    if len(a) == 0 or len(b) == 0:
+        return []
+    overlap = a[:, None, 0] <= b[None, :, 1] + 1
+    overlap &= b[None, :, 0] <= a[:, None, 1] + 1
+    ia, ib = np.nonzero(overlap)
+    return list(zip(a[ia, 2].tolist(), b[ib, 2].tolist()))
+
+
+class FragmentMerger:
+    """
+    Collects border-touching components per tile and, once a slide is done,
+    unions fragments that continue across tile edges into whole objects.
+    Memory and work scale with the number of border components, not with
+    slide area.
+    """
+
+    def __init__(self, min_radius: int = 15):
+        self.min_radius = min_radius
+        self._fragments: list[tuple[int, int, int, Fragment]] = []
+        # (level, row, col) -> (TileFragments, {label: fragment id})
+        self._tiles: dict[tuple[int, int, int], tuple[TileFragments, dict]] = {}
+
+    def add(self, level: int, row: int, col: int, tile: TileFragments) -> None:
+        ids = {}
+        for label, fragment in tile.fragments.items():
+            ids[label] = len(self._fragments)
+            self._fragments.append((level, row, col, fragment))
+        self._tiles[(level, row, col)] = (tile, ids)
+
+    def update(self, other: "FragmentMerger") -> None:
+        """Take over the tiles collected by another merger (e.g. a worker's)."""
+        for (level, row, col), (tile, _) in other._tiles.items():
+            self.add(level, row, col, tile)
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def merge(self, tile_scale: float) -> np.ndarray:
+        """Detection records (slide pixels) for the merged objects."""
+        sets = DisjointSet(len(self._fragments))
+        for (level, row, col), (tile, ids) in self._tiles.items():
+            for side, other_side, neighbour in (
+                ("right", "left", (level, row, col + 1)),
+                ("bottom", "top", (level, row + 1, col)),
+            ):
+                if neighbour not in self._tiles:
+                    continue
+                other, other_ids = self._tiles[neighbour]
+                for a, b in touching_runs(tile.edges[side], other.edges[other_side]):
+                    sets.union(ids[a], other_ids[b])
+
+        groups: dict[int, list[int]] = {}
+        for i in range(len(self._fragments)):
+            groups.setdefault(sets.find(i), []).append(i)
+
+        records = []
+        for members in groups.values():
+            parts = [self._fragments[i] for i in members]
+            points = np.concatenate([part[3].hull for part in parts])
+            (x, y), radius = cv2.minEnclosingCircle(points)
+            if radius < self.min_radius:
+                continue
+            # the object is filed under the tile holding most of it
+            level, row, col, _ = max(parts, key=lambda part: part[3].area)
+            weight = sum(part[3].weight for part in parts)
+            area = sum(part[3].area for part in parts)
+            records.append(
+                (
+                    x * tile_scale,
+                    y * tile_scale,
+                    radius * tile_scale,
+                    row,
+                    col,
+                    level,
+                    weight / max(area, 1),
+                )
+            )
+        return np.array(records, dtype=DETECTION_DTYPE)
@@ -0,0 +1,259 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+import config
+
+PACKED_STORE_NAME = "tiles.pack"
+
+_MAGIC = b"GAINSTL1"
+_TRAILER = struct.Struct("<Q8s")  # footer length, magic
+
+
+class TileStore(ABC):
+    """
+    Encoded tile images addressed by (level, row, col).
+
+    Writers call begin_level() once per pyramid level before put()-ing its
+    tiles and close() when done; readers use get()/has()/keys(). A packed
+    store also accepts put()s for levels whose grid is not known up front.
+    """
+
+    @abstractmethod
+    def begin_level(self, level: int, rows: int, cols: int) -> None:
+        pass
+
+    @abstractmethod
+    def put(self, level: int, row: int, col: int, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def get(self, level: int, row: int, col: int) -> bytes | None:
+        pass
+
+    @abstractmethod
+    def has(self, level: int, row: int, col: int) -> bool:
+        pass
+
+    @abstractmethod
+    def keys(self, level: int) -> list[tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    def grid(self, level: int) -> tuple[int, int]:
+        pass
+
+    @abstractmethod
+    def levels(self) -> list[int]:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def discard(self) -> None:
+        """Abandon a failed write. Stores that cannot roll back just close."""
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class DirectoryTileStore(TileStore):
+    """Loose files laid out as root/level<N>/tile_<row>_<col>.png"""
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    def _path(self, level: int, row: int, col: int) -> Path:
+        return self.root / f"level{level}" / f"tile_{row}_{col}.png"
+
+    def begin_level(self, level: int, rows: int, cols: int) -> None:
+        self.root.joinpath(f"level{level}").mkdir(parents=True, exist_ok=True)
+
+    def put(self, level: int, row: int, col: int, data: bytes) -> None:
+        self._path(level, row, col).write_bytes(data)
+
+    def get(self, level: int, row: int, col: int) -> bytes | None:
+        path = self._path(level, row, col)
+        return path.read_bytes() if path.exists() else None
+
+    def has(self, level: int, row: int, col: int) -> bool:
+        return self._path(level, row, col).exists()
+
+    def keys(self, level: int) -> list[tuple[int, int]]:
+        keys = []
+        for tile in self.root.joinpath(f"level{level}").glob("tile_*.png"):
+            _, r, c = tile.stem.split("_")
+            keys.append((int(r), int(c)))
+        return sorted(keys)
+
+    def grid(self, level: int) -> tuple[int, int]:
+        # find width/height by scanning filenames
+        keys = self.keys(level)
+        if not keys:
+            return 0, 0
+        return max(r for r, _ in keys) + 1, max(c for _, c in keys) + 1
+
+    def levels(self) -> list[int]:
+        return sorted(
+            int(p.name[5:])
+            for p in self.root.iterdir()
+            if p.is_dir() and p.name.startswith("level")
+        )
+
+
+class PackedTileStore(TileStore):
+    """
+    Every tile of a slide packed into one file:
+
+        magic | tile bytes ... | level indexes | JSON footer | trailer
+
+    Each level index is an int64 (rows, cols, 2) array of (offset, length)
+    pairs, length 0 marking an absent tile. Reads go through mmap, so a tile
+    lookup is two array reads and one slice. Writers fill `<path>.tmp` and
+    only replace `path` on close(), so readers never see a half-written pack.
+    """
+
+    def __init__(self, path: str | os.PathLike, mode: str = "r"):
+        if mode not in ("r", "w"):
+            raise ValueError(f"Invalid tile store mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self._index: dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()  # put() may be called from several threads
+
+        if mode == "w":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self._temp_path, "wb")
+            self._file.write(_MAGIC)
+            self._mmap = None
+            return
+
+        self._file = open(self.path, "rb")
+        if os.fstat(self._file.fileno()).st_size < len(_MAGIC) + _TRAILER.size:
+            self._file.close()
+            raise RuntimeError(f"Not a packed tile store: {self.path}")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_len, magic = _TRAILER.unpack_from(
+            self._mmap, len(self._mmap) - _TRAILER.size
+        )
+        if magic != _MAGIC or self._mmap[: len(_MAGIC)] != _MAGIC:
+            self._mmap.close()
+            self._file.close()
+            raise RuntimeError(f"Not a packed tile store: {self.path}")
+        footer_start = len(self._mmap) - _TRAILER.size - footer_len
+        footer = json.loads(self._mmap[footer_start : footer_start + footer_len])
+        for level, info in footer["levels"].items():
+            rows, cols = info["rows"], info["cols"]
+            self._index[int(level)] = np.frombuffer(
+                self._mmap, dtype=np.int64, count=rows * cols * 2, offset=info["offset"]
+            ).reshape(rows, cols, 2)
+
+    @property
+    def _temp_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".tmp")
+
+    def begin_level(self, level: int, rows: int, cols: int) -> None:
+        self._index[level] = np.zeros((rows, cols, 2), dtype=np.int64)
+
+    def put(self, level: int, row: int, col: int, data: bytes) -> None:
+        with self._lock:
+            index = self._index.get(level, np.zeros((0, 0, 2), dtype=np.int64))
+            if row >= index.shape[0] or col >= index.shape[1]:
+                # grow a level that was not begun with its final grid
+                grow_rows = max(row + 1 - index.shape[0], 0)
+                grow_cols = max(col + 1 - index.shape[1], 0)
+                index = np.pad(index, ((0, grow_rows), (0, grow_cols), (0, 0)))
+                self._index[level] = index
+            index[row, col] = (self._file.tell(), len(data))
+            self._file.write(data)
+
+    def get(self, level: int, row: int, col: int) -> bytes | None:
+        index = self._index.get(level)
+        if index is None or not (
+            0 <= row < index.shape[0] and 0 <= col < index.shape[1]
+        ):
+            return None
+        offset, length = index[row, col]
+        if length == 0:
+            return None
+        return self._mmap[offset : offset + length]
+
+    def has(self, level: int, row: int, col: int) -> bool:
+        index = self._index.get(level)
+        return (
+            index is not None
+            and 0 <= row < index.shape[0]
+            and 0 <= col < index.shape[1]
+            and bool(index[row, col, 1] > 0)
+        )
+
+    def keys(self, level: int) -> list[tuple[int, int]]:
+        rows, cols = np.nonzero(self._index[level][..., 1])
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    def grid(self, level: int) -> tuple[int, int]:
+        rows, cols, _ = self._index[level].shape
+        return rows, cols
+
+    def levels(self) -> list[int]:
+        return sorted(self._index)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        if self.mode == "w":
+            levels = {}
+            self._file.write(b"\0" * (-self._file.tell() % 8))  # align indexes
+            for level, index in self._index.items():
+                levels[str(level)] = {
+                    "rows": index.shape[0],
+                    "cols": index.shape[1],
+                    "offset": self._file.tell(),
+                }
+                self._file.write(index.tobytes())
+            footer = json.dumps({"levels": levels}).encode("utf-8")
+            self._file.write(footer)
+            self._file.write(_TRAILER.pack(len(footer), _MAGIC))
+            self._file.close()
+            # a new inode: readers that still map the old pack are unaffected
+            os.replace(self._temp_path, self.path)
+            return
+        # drop the index views before unmapping the buffer they point into
+        self._index = {}
+        self._mmap.close()
+        self._file.close()
+
+    def discard(self) -> None:
+        if self.mode != "w":
+            self.close()
+            return
+        if not self._file.closed:
+            self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
+
+def open_tile_store(tiles_root: str | os.PathLike, mode: str = "r") -> TileStore:
+    tiles_root = Path(tiles_root)
+    packed_path = tiles_root / PACKED_STORE_NAME
+    if mode == "w":
+        if config.PACKED_TILES:
+            return PackedTileStore(packed_path, mode="w")
+        # a stale pack would shadow the new tile files on read
+        packed_path.unlink(missing_ok=True)
+        return DirectoryTileStore(tiles_root)
+    if packed_path.exists():
+        return PackedTileStore(packed_path)
+    return DirectoryTileStore(tiles_root)
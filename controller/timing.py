@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import config
+
+TRACE_NAME = "timings.trace.json"
+SUMMARY_NAME = "timings.txt"
+
+# (stage, pid, tid, start ns, duration ns); perf_counter_ns is a system-wide
+# monotonic clock, so events from worker processes line up with the parent's
+Event = tuple[str, int, int, int, int]
+
+
+class _Span:
+    __slots__ = ("timings", "stage", "start")
+
+    def __init__(self, timings: "StageTimings", stage: str):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc) -> None:
+        self.timings.add(self.stage, self.start, time.perf_counter_ns())
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class StageTimings:
+    """
+    Per-slide stage timings. Every span adds to a per-stage count, total and
+    maximum; the individual spans are also kept as trace events, up to
+    `max_events`. Worker processes record into a child() that travels back
+    with their results and is merge()d by the parent.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        enabled: bool | None = None,
+        max_events: int | None = None,
+    ):
+        if enabled is None:
+            enabled = config.STAGE_TIMING
+        if max_events is None:
+            max_events = config.STAGE_TRACE_MAX_EVENTS
+        self.name = name
+        self.enabled = enabled
+        self.max_events = max_events
+        self.totals: dict[str, list[int]] = {}  # stage -> [count, total, max]
+        self.events: list[Event] = []
+        self.dropped = 0
+        self.started = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def span(self, stage: str):
+        """Context manager timing its body as one `stage` span."""
+        return _Span(self, stage) if self.enabled else _NO_SPAN
+
+    def add(
+        self,
+        stage: str,
+        start_ns: int,
+        end_ns: int,
+        pid: int | None = None,
+        tid: int | None = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        duration = end_ns - start_ns
+        event = (
+            stage,
+            pid if pid is not None else os.getpid(),
+            tid if tid is not None else threading.get_native_id(),
+            start_ns,
+            duration,
+        )
+        with self._lock:
+            total = self.totals.get(stage)
+            if total is None:
+                self.totals[stage] = [1, duration, duration]
+            else:
+                total[0] += 1
+                total[1] += duration
+                total[2] = max(total[2], duration)
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def child(self) -> "StageTimings":
+        """Empty timings with the same settings, for a worker process."""
+        return StageTimings(self.name, self.enabled, self.max_events)
+
+    def merge(self, other: "StageTimings") -> None:
+        if not self.enabled or other is None:
+            return
+        with self._lock:
+            for stage, (count, total, longest) in other.totals.items():
+                mine = self.totals.setdefault(stage, [0, 0, 0])
+                mine[0] += count
+                mine[1] += total
+                mine[2] = max(mine[2], longest)
+            room = max(self.max_events - len(self.events), 0)
+            self.events.extend(other.events[:room])
+            self.dropped += other.dropped + max(len(other.events) - room, 0)
+
+    def summary(self) -> dict[str, dict]:
+        """Per-stage count, total/mean/max time and share of all stage time."""
+        with self._lock:
+            totals = {stage: list(total) for stage, total in self.totals.items()}
+        overall = sum(total for _, total, _ in totals.values()) or 1
+        return {
+            stage: {
+                "count": count,
+                "total_s": round(total / 1e9, 4),
+                "mean_ms": round(total / count / 1e6, 4),
+                "max_ms": round(longest / 1e6, 4),
+                "share": round(total / overall, 4),
+            }
+            for stage, (count, total, longest) in sorted(
+                totals.items(), key=lambda item: -item[1][1]
+            )
+        }
+
+    def summary_table(self) -> str:
+        # stages overlap across threads and processes, so shares are of the
+        # summed stage time, not of wall-clock time
+        wall = (time.perf_counter_ns() - self.started) / 1e9
+        lines = [
+            f"{self.name}: {wall:.2f} s wall clock",
+            f"{'stage':<20}{'count':>9}{'total s':>11}{'mean ms':>11}"
+            f"{'max ms':>11}{'share':>8}",
+        ]
+        for stage, row in self.summary().items():
+            lines.append(
+                f"{stage:<20}{row['count']:>9}{row['total_s']:>11.3f}"
+                f"{row['mean_ms']:>11.3f}{row['max_ms']:>11.3f}"
+                f"{row['share']:>8.1%}"
+            )
+        if self.dropped:
+            lines.append(f"({self.dropped} spans beyond the trace event limit)")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """The events in Chrome trace format (chrome://tracing, Perfetto)."""
+        with self._lock:
+            events = list(self.events)
+        trace = [
+            {
+                "name": stage,
+                "cat": "stage",
+                "ph": "X",
+                "ts": (start - self.started) / 1e3,
+                "dur": duration / 1e3,
+                "pid": pid,
+                "tid": tid,
+            }
+            for stage, pid, tid, start, duration in events
+        ]
+        parent = os.getpid()
+        for pid in sorted({event[1] for event in events}):
+            label = self.name if pid == parent else f"{self.name} worker {pid}"
+            trace.append(
+                {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}}
+            )
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def write(self, output_dir: str | os.PathLike) -> None:
+        """Write the summary table and the trace next to a slide's results."""
+        if not self.enabled:
+            return
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        (output_dir / SUMMARY_NAME).write_text(self.summary_table() + "\n")
+        (output_dir / TRACE_NAME).write_text(json.dumps(self.chrome_trace()))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+# Default for code paths called without a slide's timings
+NO_TIMINGS = StageTimings("", enabled=False)
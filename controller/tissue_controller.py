@@ -0,0 +1,82 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import openslide
+
+import config
+
+TISSUE_INDEX_NAME = "tissue_index.npz"
+
+
+def detect_tissue(
+    slide: openslide.OpenSlide,
+    max_size: int | None = None,
+    white_cutoff: int = 235,
+) -> tuple[np.ndarray, tuple[float, float]]:
+    """
+    Boolean tissue mask of the whole slide at thumbnail resolution, together
+    with the (x, y) level-0 pixels covered by one mask pixel.
+    """
+    if max_size is None:
+        max_size = config.TISSUE_THUMBNAIL_SIZE
+    lowest = slide.level_count - 1
+    w, h = slide.level_dimensions[lowest]
+    if max(w, h) <= max_size:
+        arr = np.asarray(slide.read_region((0, 0), lowest, (w, h)))
+        # transparent padding is background, not tissue
+        tissue = ~np.all(arr[..., :3] > white_cutoff, axis=-1) & (arr[..., 3] > 0)
+    else:
+        arr = np.asarray(slide.get_thumbnail((max_size, max_size)).convert("RGB"))
+        tissue = ~np.all(arr > white_cutoff, axis=-1)
+
+    level0_w, level0_h = slide.dimensions
+    scale = (level0_w / tissue.shape[1], level0_h / tissue.shape[0])
+    return tissue, scale
+
+
+def tile_grid_mask(
+    tissue: np.ndarray,
+    scale: tuple[float, float],
+    region_size: float,
+    rows: int,
+    cols: int,
+) -> np.ndarray:
+    """
+    Reduce a thumbnail tissue mask onto a rows×cols tile grid whose regions
+    are `region_size` level-0 pixels wide. A tile is kept when any tissue
+    pixel (with a one pixel safety margin) falls inside it.
+    """
+    h, w = tissue.shape
+    integral = np.zeros((h + 1, w + 1), dtype=np.int64)
+    integral[1:, 1:] = tissue.cumsum(axis=0).cumsum(axis=1)
+
+    x_edges = np.arange(cols + 1) * region_size / scale[0]
+    y_edges = np.arange(rows + 1) * region_size / scale[1]
+    x0 = np.clip(np.floor(x_edges[:-1]).astype(np.int64) - 1, 0, w)
+    x1 = np.clip(np.ceil(x_edges[1:]).astype(np.int64) + 1, 0, w)
+    y0 = np.clip(np.floor(y_edges[:-1]).astype(np.int64) - 1, 0, h)
+    y1 = np.clip(np.ceil(y_edges[1:]).astype(np.int64) + 1, 0, h)
+
+    counts = (
+        integral[y1][:, x1]
+        - integral[y0][:, x1]
+        - integral[y1][:, x0]
+        + integral[y0][:, x0]
+    )
+    return counts > 0
+
+
+def save_tissue_index(out_dir: str | os.PathLike, index: dict[int, np.ndarray]):
+    np.savez_compressed(
+        Path(out_dir) / TISSUE_INDEX_NAME,
+        **{f"level{level}": mask for level, mask in index.items()},
+    )
+
+
+def load_tissue_index(tiles_root: str | os.PathLike) -> dict[int, np.ndarray] | None:
+    index_path = Path(tiles_root) / TISSUE_INDEX_NAME
+    if not index_path.exists():
+        return None
+    with np.load(index_path) as data:
+        return {int(key[5:]): data[key] for key in data.files}
@@ -1,33 +1,205 @@
+import queue
 import threading
+from concurrent.futures import Future
 from pathlib import Path
 
-from controller.infer_controller import infer
-from controller.wsi_controller import generate_tiles
-from state.progress_info import ProgressInfo
+import numpy as np
 
-MAX_RUNNING = 1
-SEMAPHORE = threading.BoundedSemaphore(MAX_RUNNING)
+import config
+from controller.infer_controller import (
+    InferenceOutputs,
+    close_inference_outputs,
+    finish_inference,
+    infer,
+    infer_stream,
+    sharding_enabled,
+)
+from controller.progress import ProgressInfo
+from controller.scheduler import Job, JobScheduler
+from controller.wsi_controller import TileSink, generate_tiles
 
+_scheduler: JobScheduler | None = None
+_scheduler_lock = threading.Lock()
 
-def start_image_processing(
+
+def get_scheduler() -> JobScheduler:
+    # created on first use, so processes that only import this module (e.g.
+    # spawned workers re-importing __main__) start no threads
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(config.STAGE_CONCURRENCY)
+        return _scheduler
+
+
+def __queue_put(tile_queue: queue.Queue, item, consumer: Future, job: Job) -> None:
+    # block on the bounded queue, but never on a consumer that has died (or
+    # was cancelled before it started)
+    while True:
+        job.raise_if_cancelled()
+        if consumer.done():
+            consumer.result()  # re-raise the consumer's error
+            raise RuntimeError("Inference stopped before tiling finished")
+        try:
+            tile_queue.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def __fail_stream(tile_queue: queue.Queue, exc: BaseException) -> None:
+    # drop what the consumer has not taken yet, so the failure fits whether or
+    # not the consumer ever runs; it raises `exc` instead of ending cleanly
+    while True:
+        try:
+            tile_queue.get_nowait()
+        except queue.Empty:
+            break
+    tile_queue.put_nowait(exc)
+
+
+def __stream_sink(tile_queue: queue.Queue, consumer: Future, job: Job) -> TileSink:
+    def sink(row: int, col: int, tile: np.ndarray) -> None:
+        __queue_put(tile_queue, (row, col, tile), consumer, job)
+
+    return sink
+
+
+def image_processing_job(
     svs_path: str,
     base_tile_out_dir: str,
     infer_tile_out_dir: str,
     progress_info: ProgressInfo,
     *,
     tile_size: int = 512,
-    model_path: str = Path("assets")
-    .joinpath("ai_models", "old_best_checkpoint.ckpt")
-    .as_posix(),
-) -> None:
-    with SEMAPHORE:
+    model_path: str | None = None,
+    priority: int = 0,
+) -> Job:
+    """
+    Build the pipeline job for one slide: tiling, inference, then slide-level
+    postprocessing (cross-tile merge, spatial index, closing outputs).
+    Streamed slides run tiling and inference together, the tiles passing
+    through a bounded queue that applies back-pressure when inference falls
+    behind; each holds its own stage's slot, so the next slide's tiling
+    starts as soon as this one's ends.
+    """
+
+    if model_path is None:
+        model_path = config.MODEL_PATH
+
+    def keep_outputs(job: Job, outputs: InferenceOutputs) -> None:
+        job.state["outputs"] = outputs
+        job.cleanups.append(lambda: close_inference_outputs(outputs))
+
+    def tiling(job: Job) -> None:
         generate_tiles(svs_path, base_tile_out_dir, tile_size, progress_info)
-        infer(
-            Path(base_tile_out_dir).joinpath("level0").as_posix(),
+
+    def inference(job: Job) -> None:
+        outputs = infer(
+            base_tile_out_dir,
             infer_tile_out_dir,
             model_path,
             progress_info,
+            svs_path=svs_path,
+            finalize=False,
         )
+        keep_outputs(job, outputs)
+
+    tile_queue = queue.Queue(maxsize=config.STREAM_QUEUE_SIZE)
+    consumer = Future()  # settled by streamed_inference
+
+    def streamed_tiling(job: Job) -> None:
+        try:
+            generate_tiles(
+                svs_path,
+                base_tile_out_dir,
+                tile_size,
+                progress_info,
+                tile_sink=__stream_sink(tile_queue, consumer, job),
+            )
+        except BaseException as exc:
+            __fail_stream(tile_queue, exc)
+            raise
+        __queue_put(tile_queue, None, consumer, job)
+
+    def streamed_inference(job: Job) -> None:
+        try:
+            outputs = infer_stream(
+                tile_queue,
+                infer_tile_out_dir,
+                model_path,
+                progress_info,
+                svs_path=svs_path,
+                finalize=False,
+            )
+        except BaseException as exc:
+            consumer.set_exception(exc)
+            raise
+        consumer.set_result(None)
+        keep_outputs(job, outputs)
+
+    def postprocessing(job: Job) -> None:
+        finish_inference(job.state["outputs"], progress_info)
+        progress_info.timings.write(infer_tile_out_dir)
         progress_info.status = "Processing complete"
         progress_info.percent_complete = 100
         progress_info.progress_changed.emit()
+
+    # sharded inference works on the stored tile list, not on the stream
+    if config.STREAM_TILES_TO_INFERENCE and not sharding_enabled():
+        stages = [
+            (("tiling", streamed_tiling), ("inference", streamed_inference)),
+            ("postprocessing", postprocessing),
+        ]
+    else:
+        stages = [
+            ("tiling", tiling),
+            ("inference", inference),
+            ("postprocessing", postprocessing),
+        ]
+    return Job(
+        Path(svs_path).stem, stages, priority=priority, progress_info=progress_info
+    )
+
+
+def submit_image_processing(
+    svs_path: str,
+    base_tile_out_dir: str,
+    infer_tile_out_dir: str,
+    progress_info: ProgressInfo,
+    *,
+    tile_size: int = 512,
+    model_path: str | None = None,
+    priority: int = 0,
+    scheduler: JobScheduler | None = None,
+) -> Job:
+    job = image_processing_job(
+        svs_path,
+        base_tile_out_dir,
+        infer_tile_out_dir,
+        progress_info,
+        tile_size=tile_size,
+        model_path=model_path,
+        priority=priority,
+    )
+    return (scheduler or get_scheduler()).submit(job)
+
+
+def start_image_processing(
+    svs_path: str,
+    base_tile_out_dir: str,
+    infer_tile_out_dir: str,
+    progress_info: ProgressInfo,
+    *,
+    tile_size: int = 512,
+    model_path: str | None = None,
+) -> None:
+    """Process a slide through the shared scheduler and wait for it."""
+    submit_image_processing(
+        svs_path,
+        base_tile_out_dir,
+        infer_tile_out_dir,
+        progress_info,
+        tile_size=tile_size,
+        model_path=model_path,
+    ).result()
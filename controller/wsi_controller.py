@@ -1,14 +1,314 @@
+import io
 import math
+import multiprocessing
 import os
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Iterable, Iterator, NamedTuple, Tuple
 
 import numpy as np
 import openslide
 from PIL import Image
 
+import config
 from controller.image_controller import __mostly_white
-from state.progress_info import ProgressInfo
+from controller.progress import ProgressInfo
+from controller.tile_store import TileStore, open_tile_store
+from controller.timing import NO_TIMINGS, StageTimings
+from controller.tissue_controller import (
+    detect_tissue,
+    save_tissue_index,
+    tile_grid_mask,
+)
+
+# Called with (row, col, RGB uint8 array) for every level-0 tissue tile
+TileSink = Callable[[int, int, np.ndarray], None]
+
+# Level-0 pixels covered by one pixel of a level-0 tile
+LEVEL0_TILE_SCALE = 2
+
+
+class LevelPlan(NamedTuple):
+    level: int  # pyramid level the tile grid belongs to
+    read_level: int  # pyramid level pixels are actually read from
+    stride: int  # tile step in `level` pixels
+    request_wh: Tuple[int, int]  # region size read at `read_level`
+    rows: int
+    cols: int
+
+
+# Slide handle owned by a tiling worker process (see __init_tile_worker)
+_worker_slide: openslide.OpenSlide | None = None
+
+
+def __init_tile_worker(svs_path: str) -> None:
+    # OpenSlide handles are not picklable, so every worker opens its own
+    global _worker_slide
+    _worker_slide = openslide.OpenSlide(svs_path)
+
+
+def __encode_png(tile: np.ndarray, timings: StageTimings = NO_TIMINGS) -> bytes:
+    with timings.span("png_encode"):
+        buffer = io.BytesIO()
+        Image.fromarray(tile).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+def __is_white(rgba: np.ndarray, timings: StageTimings) -> bool:
+    with timings.span("whiteness"):
+        return __mostly_white(rgba, white_cutoff=235, max_white_ratio=0.97)
+
+
+def __finish_tile(
+    rgba: np.ndarray,
+    tile_size: int,
+    fast_resize: bool,
+    timings: StageTimings = NO_TIMINGS,
+) -> np.ndarray:
+    with timings.span("composite_resize"):
+        return __composite_and_resize(rgba, tile_size, fast_resize)
+
+
+def __composite_and_resize(
+    rgba: np.ndarray, tile_size: int, fast_resize: bool
+) -> np.ndarray:
+    # Replace black transparent padding with white
+    alpha = rgba[..., 3:]
+    if alpha.min() == 255:
+        rgb = rgba[..., :3]
+    else:
+        rgb = (
+            rgba[..., :3] * (alpha / 255.0) + 255.0 * (1.0 - alpha / 255.0) + 0.5
+        ).astype(np.uint8)
+
+    height, width = rgb.shape[:2]
+    if (width, height) == (tile_size, tile_size):
+        return np.ascontiguousarray(rgb)
+
+    factor = width // tile_size
+    if fast_resize and width == height and width == factor * tile_size:
+        # integer area average, rounded like PIL's Image.reduce()
+        sums = rgb.reshape(tile_size, factor, tile_size, factor, 3).sum(
+            axis=(1, 3), dtype=np.uint32
+        )
+        return ((sums + factor * factor // 2) // (factor * factor)).astype(np.uint8)
+
+    # area averaging (BOX) on the fast path, LANCZOS on the legacy one
+    resample = Image.Resampling.BOX if fast_resize else Image.Resampling.LANCZOS
+    return np.asarray(Image.fromarray(rgb).resize((tile_size, tile_size), resample))
+
+
+def __read_tile(
+    slide: openslide.OpenSlide,
+    read_level: int,
+    location: Tuple[int, int],
+    request_wh: Tuple[int, int],
+    tile_size: int,
+    fast_resize: bool,
+    timings: StageTimings = NO_TIMINGS,
+) -> np.ndarray | None:
+    with timings.span("read_region"):
+        rgba = np.asarray(slide.read_region(location, read_level, request_wh))
+    if __is_white(rgba, timings):
+        return None
+    return __finish_tile(rgba, tile_size, fast_resize, timings)
+
+
+def __strip_spans(columns: np.ndarray, max_cols: int) -> list[tuple[int, int]]:
+    # contiguous runs of tissue columns, split into strips of <= max_cols
+    spans = []
+    for run in np.split(columns, np.flatnonzero(np.diff(columns) > 1) + 1):
+        for start in range(0, len(run), max_cols):
+            chunk = run[start : start + max_cols]
+            spans.append((int(chunk[0]), int(chunk[-1]) + 1))
+    return spans
+
+
+def __tile_band(
+    slide: openslide.OpenSlide,
+    plan: LevelPlan,
+    row0: int,
+    tissue_band: np.ndarray,
+    tile_size: int,
+    fast_resize: bool,
+    strip_cols: int,
+    encode: bool = True,
+    timings: StageTimings = NO_TIMINGS,
+) -> list[tuple[int, int, bytes | np.ndarray]]:
+    downsample = slide.level_downsamples[plan.level]  # 1.0 at level-0
+    req_w, req_h = plan.request_wh
+    band_rows = tissue_band.shape[0]
+
+    tiles = []
+    # columns the thumbnail tissue mask rules out are never read
+    columns = np.flatnonzero(tissue_band.any(axis=0))
+    if len(columns) == 0:
+        return tiles
+
+    for col0, col1 in __strip_spans(columns, strip_cols):
+        # top-left of the strip in THIS level’s coords, converted to
+        # level-0 coords for read_region()
+        x0 = int(col0 * plan.stride * downsample)
+        y0 = int(row0 * plan.stride * downsample)
+
+        # ── one read per strip, tiles are views into it ─────────────
+        with timings.span("read_region"):
+            strip = np.asarray(
+                slide.read_region(
+                    (x0, y0),
+                    plan.read_level,
+                    ((col1 - col0) * req_w, band_rows * req_h),
+                )
+            )
+        for r, c in np.argwhere(tissue_band[:, col0:col1]).tolist():
+            rgba = strip[r * req_h : (r + 1) * req_h, c * req_w : (c + 1) * req_w]
+            if __is_white(rgba, timings):
+                continue
+            tile = __finish_tile(rgba, tile_size, fast_resize, timings)
+            tiles.append(
+                (row0 + r, col0 + c, __encode_png(tile, timings) if encode else tile)
+            )
+
+    return tiles
+
+
+def __tile_band_worker(
+    plan: LevelPlan,
+    row0: int,
+    tissue_band: np.ndarray,
+    tile_size: int,
+    fast_resize: bool,
+    strip_cols: int,
+    encode: bool = True,
+    timings: StageTimings = NO_TIMINGS,
+) -> tuple[int, list[tuple[int, int, bytes | np.ndarray]], StageTimings]:
+    # `timings` is the worker's own copy; it goes back with the tiles
+    tiles = __tile_band(
+        _worker_slide,
+        plan,
+        row0,
+        tissue_band,
+        tile_size,
+        fast_resize,
+        strip_cols,
+        encode,
+        timings,
+    )
+    return len(tissue_band), tiles, timings
+
+
+def plan_levels(
+    slide: openslide.OpenSlide, tile_size: int, native_reads: bool
+) -> list[LevelPlan]:
+    level_plans = []
+    for level_idx in range(slide.level_count):
+        read_level = level_idx
+        if level_idx == 0:
+            stride = tile_size * LEVEL0_TILE_SCALE  # move 1024 px per tile
+            request_wh: Tuple[int, int] = (stride, stride)
+            if native_reads:
+                # read from the pyramid level closest to the output
+                # magnification instead of decoding every level-0 pixel
+                read_level = slide.get_best_level_for_downsample(
+                    stride / tile_size * 1.01
+                )
+                read_px = round(stride / slide.level_downsamples[read_level])
+                request_wh = (read_px, read_px)
+        else:
+            stride = tile_size  # native stride
+            request_wh = (tile_size, tile_size)
+
+        level_w, level_h = slide.level_dimensions[level_idx]
+        cols = math.ceil(level_w / stride)
+        rows = math.ceil(level_h / stride)
+        level_plans.append(
+            LevelPlan(level_idx, read_level, stride, request_wh, rows, cols)
+        )
+    return level_plans
+
+
+def sample_tissue_positions(
+    slide: openslide.OpenSlide, plan: LevelPlan, count: int
+) -> list[tuple[int, int]]:
+    # evenly spaced tissue tiles of a level's grid
+    tissue, scale = detect_tissue(slide)
+    mask = tile_grid_mask(
+        tissue,
+        scale,
+        plan.stride * slide.level_downsamples[plan.level],
+        plan.rows,
+        plan.cols,
+    )
+    positions = np.argwhere(mask)
+    if len(positions) > count:
+        positions = positions[np.linspace(0, len(positions) - 1, count).astype(int)]
+    return [(int(r), int(c)) for r, c in positions]
+
+
+def read_tissue_tiles(
+    svs_path: str | os.PathLike,
+    count: int,
+    tile_size: int = 512,
+    native_reads: bool | None = None,
+) -> list[np.ndarray]:
+    """Up to `count` non-white level-0 RGB tiles spread over the slide's tissue."""
+    if native_reads is None:
+        native_reads = config.NATIVE_LEVEL_READS
+    slide = openslide.OpenSlide(svs_path)
+    try:
+        plan = plan_levels(slide, tile_size, native_reads)[0]
+        tiles = []
+        for row, col in sample_tissue_positions(slide, plan, count):
+            tile = __read_tile(
+                slide,
+                plan.read_level,
+                (col * plan.stride, row * plan.stride),
+                plan.request_wh,
+                tile_size,
+                native_reads,
+            )
+            if tile is not None:
+                tiles.append(tile)
+        return tiles
+    finally:
+        slide.close()
+
+
+def __bounded_results(
+    pool: Executor, fn: Callable, arg_list: Iterable[tuple], window: int
+) -> Iterator:
+    # keep at most `window` bands in flight so finished ones waiting on a slow
+    # consumer cannot pile up in memory
+    arg_iter = iter(arg_list)
+    pending = {pool.submit(fn, *args) for _, args in zip(range(window), arg_iter)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            next_args = next(arg_iter, None)
+            if next_args is not None:
+                pending.add(pool.submit(fn, *next_args))
+            yield future.result()  # re-raises worker errors here
+
+
+def __encode_and_put(
+    store: TileStore,
+    level_idx: int,
+    row: int,
+    col: int,
+    tile: np.ndarray,
+    timings: StageTimings = NO_TIMINGS,
+) -> None:
+    data = __encode_png(tile, timings)
+    with timings.span("tile_save"):
+        store.put(level_idx, row, col, data)
 
 
 def generate_tiles(
@@ -16,71 +316,126 @@ def generate_tiles(
     out_dir: str | os.PathLike,
     tile_size: int,
     progress_info: ProgressInfo,
+    *,
+    workers: int | None = None,
+    tile_sink: TileSink | None = None,
+    native_reads: bool | None = None,
+    strip_rows: int | None = None,
+    strip_cols: int | None = None,
 ) -> None:
+    if workers is None:
+        workers = config.TILING_WORKERS
+    if native_reads is None:
+        native_reads = config.NATIVE_LEVEL_READS
+    if strip_rows is None:
+        strip_rows = config.STRIP_ROWS
+    if strip_cols is None:
+        strip_cols = config.STRIP_COLS
     svs_path = Path(svs_path)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
     slide = openslide.OpenSlide(svs_path)
 
-    for level_idx in range(slide.level_count):
-        progress_info.status = f"Tiling level {level_idx}"
-        progress_info.percent_complete = 0
-        progress_info.progress_changed.emit()
+    # ── determine stride & request size for every level ─────────────────
+    level_plans = plan_levels(slide, tile_size, native_reads)
 
-        level_out = out_dir / f"level{level_idx}"
-        level_out.mkdir(parents=True, exist_ok=True)
+    # ── tissue index from the thumbnail, shared with inference ──────────
+    tissue, scale = detect_tissue(slide)
+    tissue_index = {
+        plan.level: tile_grid_mask(
+            tissue,
+            scale,
+            plan.stride * slide.level_downsamples[plan.level],
+            plan.rows,
+            plan.cols,
+        )
+        for plan in level_plans
+    }
+    save_tissue_index(out_dir, tissue_index)
+    timings = progress_info.timings
 
-        # ── determine stride & request size for this level ──────────────
-        if level_idx == 0:
-            stride = tile_size * 2  # move 1024 px per tile in source
-            request_wh: Tuple[int, int] = (stride, stride)
-        else:
-            stride = tile_size  # native stride
-            request_wh = (tile_size, tile_size)
+    # Bands of the tile grid are farmed out to worker processes; "spawn" keeps
+    # children from inheriting the Qt threads of the GUI process.
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=__init_tile_worker,
+            initargs=(svs_path.as_posix(),),
+        )
 
-        level_w, level_h = slide.level_dimensions[level_idx]
-        cols = math.ceil(level_w / stride)
-        rows = math.ceil(level_h / stride)
-        total_iterations = cols * rows
-        current_iteration = 0
-
-        downsample = slide.level_downsamples[level_idx]  # 1.0 at level-0
-
-        for row in range(rows):
-            for col in range(cols):
-                # top-left of the region in THIS level’s coords
-                x_lv = col * stride
-                y_lv = row * stride
-
-                # convert to level-0 coords for read_region()
-                x0 = int(x_lv * downsample)
-                y0 = int(y_lv * downsample)
-
-                # ── read & save ─────────────────────────────────────────
-                img = slide.read_region((x0, y0), level_idx, request_wh)
-                if __mostly_white(
-                    np.array(img), white_cutoff=235, max_white_ratio=0.97
-                ):
-                    current_iteration += 1
-                    progress_info.percent_complete = int(
-                        current_iteration / total_iterations * 100
-                    )
-                    progress_info.status = str(
-                        f"Tiling level {level_idx} ({current_iteration}/{total_iterations})"
-                    )
-                    progress_info.progress_changed.emit()
-                    continue
-                # Replace black transparent padding with white
-                bg = Image.new("RGB", img.size, (255, 255, 255))
-                img = Image.alpha_composite(bg.convert("RGBA"), img).convert("RGB")
+    # When streaming, level-0 tiles go to `tile_sink` as raw arrays and the
+    # PNGs the viewer needs are encoded off the critical path by this pool.
+    side_output = ThreadPoolExecutor(max_workers=2) if tile_sink else None
+    side_slots = threading.BoundedSemaphore(config.STREAM_QUEUE_SIZE)
+    side_writes: list[Future] = []
+
+    # workers only read & encode; this process owns the store
+    store = open_tile_store(out_dir, mode="w")
+    finished = False
+    try:
+        for plan in level_plans:
+            level_idx, rows, cols = plan.level, plan.rows, plan.cols
+            progress_info.status = f"Tiling level {level_idx}"
+            progress_info.percent_complete = 0
+            progress_info.progress_changed.emit()
 
-                if level_idx == 0:
-                    img = img.resize((tile_size, tile_size), Image.Resampling.LANCZOS)
+            store.begin_level(level_idx, rows, cols)
 
-                img.save(level_out / f"tile_{row}_{col}.png", format="PNG")
+            level_mask = tissue_index[level_idx]
+            tissue_bands = [
+                row0
+                for row0 in range(0, rows, strip_rows)
+                if level_mask[row0 : row0 + strip_rows].any()
+            ]
+            total_iterations = cols * rows
+            # bands without any tissue are complete without being read
+            current_iteration = cols * rows - sum(
+                cols * len(level_mask[row0 : row0 + strip_rows])
+                for row0 in tissue_bands
+            )
 
-                current_iteration += 1
+            streaming = tile_sink is not None and level_idx == 0
+            band_args = [
+                (
+                    plan,
+                    row0,
+                    level_mask[row0 : row0 + strip_rows],
+                    tile_size,
+                    native_reads,
+                    strip_cols,
+                    not streaming,
+                    timings if pool is None else timings.child(),
+                )
+                for row0 in tissue_bands
+            ]
+            if pool is None:
+                finished_bands = (
+                    (len(args[2]), __tile_band(slide, *args), None)
+                    for args in band_args
+                )
+            else:
+                finished_bands = __bounded_results(
+                    pool, __tile_band_worker, band_args, workers * 2
+                )
+
+            for band_rows, tiles, band_timings in finished_bands:
+                timings.merge(band_timings)
+                for row, col, tile in tiles:
+                    if not streaming:
+                        with timings.span("tile_save"):
+                            store.put(level_idx, row, col, tile)
+                        continue
+                    tile_sink(row, col, tile)
+                    side_slots.acquire()  # bound the tiles awaiting encoding
+                    future = side_output.submit(
+                        __encode_and_put, store, level_idx, row, col, tile, timings
+                    )
+                    future.add_done_callback(lambda _: side_slots.release())
+                    side_writes.append(future)
+                current_iteration += cols * band_rows
                 progress_info.percent_complete = int(
                     current_iteration / total_iterations * 100
                 )
@@ -89,4 +444,16 @@ def generate_tiles(
                 )
                 progress_info.progress_changed.emit()
 
-    slide.close()
+        for future in side_writes:
+            future.result()  # surface side output errors
+        finished = True
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if side_output is not None:
+            side_output.shutdown(wait=True)
+        if finished:
+            store.close()
+        else:
+            store.discard()  # a packed store keeps the previous run's tiles
+        slide.close()
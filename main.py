@@ -2,6 +2,8 @@ import sys
 
 from PySide6.QtWidgets import QApplication
 
+import config
+from controller.infer_controller import warm_up_model
 from controller.temp_dir import TEMP_DIR_OBJ
 from state import create_state, get_state
 from view.main_window import MainWindow
@@ -10,6 +12,8 @@ from view.main_window import MainWindow
 def main():
     app = QApplication(sys.argv)
     create_state(app)
+    if config.MODEL_WARM_UP:
+        warm_up_model()
     get_state().new_project(name="New Project")
     window = MainWindow()
     window.show()
@@ -0,0 +1,91 @@
+import copy
+import warnings
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+class InferenceModel(nn.Module):
+    """
+    Eval-only wrapper that feeds the wrapped model channels_last inputs and
+    optionally runs it under CPU bf16 autocast, returning float32 logits.
+    """
+
+    def __init__(self, model: nn.Module, channels_last: bool, bf16: bool):
+        super().__init__()
+        self.model = model
+        self.channels_last = channels_last
+        self.bf16 = bf16
+
+    def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        if not self.bf16:
+            return self.model(x)
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            out = self.model(x)
+        return out.float()
+
+
+def fuse_conv_bn(model: nn.Module) -> int:
+    """Fold every Conv2d→BatchNorm2d pair inside nn.Sequential containers."""
+    fused = 0
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        names = list(module._modules)
+        for name, next_name in zip(names, names[1:]):
+            conv, bn = module._modules[name], module._modules[next_name]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                module._modules[name] = fuse_conv_bn_eval(conv, bn)
+                module._modules[next_name] = nn.Identity()
+                fused += 1
+    return fused
+
+
+def bf16_supported() -> bool:
+    is_supported = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    try:
+        return bool(is_supported and is_supported())
+    except RuntimeError:
+        return False
+
+
+def prepare_for_inference(
+    model: nn.Module,
+    *,
+    channels_last: bool = True,
+    bf16: bool = False,
+    tolerance: float = 1e-3,
+    check_size: tuple[int, int] = (128, 128),
+) -> nn.Module:
+    """
+    Fuse Conv+BN pairs of an eval-mode NestedUNet / UNet and switch it to
+    channels_last. The fused model is only kept if its logits stay within
+    `tolerance` of the unfused ones on a random check batch.
+    """
+    model.eval()
+    device = next(model.parameters()).device
+    reference = copy.deepcopy(model)
+
+    fuse_conv_bn(model)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    generator = torch.Generator().manual_seed(0)
+    example = torch.rand((1, 3, *check_size), generator=generator).to(device)
+    with torch.no_grad():
+        expected = reference(example)
+        actual = InferenceModel(model, channels_last, bf16=False)(example)
+    max_error = (expected - actual).abs().max().item()
+    if max_error > tolerance:
+        warnings.warn(
+            f"Fused model differs from unfused by {max_error:.2e}; keeping unfused"
+        )
+        model, channels_last = reference, False
+
+    use_bf16 = bf16 and device.type == "cpu" and bf16_supported()
+    if not channels_last and not use_bf16:
+        return model
+    return InferenceModel(model, channels_last, use_bf16).eval()
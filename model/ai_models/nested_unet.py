@@ -1,8 +1,18 @@
 import torch
+import torch.fx
 import torch.nn as nn
 import torch.nn.functional as F
 
 
+@torch.fx.wrap
+def resize_to(x, size):
+    # resizing to the size we already have is an identity; skip it. Wrapped
+    # as an FX leaf so the shape check does not break graph tracing.
+    if tuple(x.shape[-2:]) == tuple(size):
+        return x
+    return F.interpolate(x, size=size, mode="bilinear", align_corners=False)
+
+
 class ConvBlock(nn.Module):
     def __init__(self, in_ch, out_ch):
         super().__init__()
@@ -54,7 +64,4 @@ class NestedUNet(nn.Module):
         x0_2 = self.conv0_2(torch.cat([x0_0, x0_1, self.up1_1(x1_1)], dim=1))
 
         out = self.final(x0_2)
-        out = F.interpolate(
-            out, size=self.out_size, mode="bilinear", align_corners=False
-        )
-        return out
+        return resize_to(out, self.out_size)
@@ -0,0 +1,64 @@
+"""
+Time viewport queries and region counts on the detection spatial index with
+synthetic detections scattered over a slide-sized area.
+
+Run from the repository root:
+    python -m scripts.bench_detection_index --detections 100000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from controller.detections import DETECTION_DTYPE, DetectionIndex
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark detection index queries")
+    parser.add_argument("--detections", type=int, default=100_000)
+    parser.add_argument("--slide-size", type=int, default=100_000, help="Slide pixels")
+    parser.add_argument("--viewport", type=int, default=4096, help="Query edge, px")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    table = np.zeros(args.detections, dtype=DETECTION_DTYPE)
+    table["x"] = rng.uniform(0, args.slide_size, args.detections)
+    table["y"] = rng.uniform(0, args.slide_size, args.detections)
+    table["radius"] = rng.uniform(30, 150, args.detections)
+
+    start = time.perf_counter()
+    index = DetectionIndex.build(table, tile_scale=2.0)
+    build_s = time.perf_counter() - start
+
+    corners = rng.uniform(0, args.slide_size - args.viewport, (args.queries, 2))
+    rects = [(x, y, x + args.viewport, y + args.viewport) for x, y in corners]
+
+    start = time.perf_counter()
+    hits = [len(index.query(*rect)) for rect in rects]
+    query_s = (time.perf_counter() - start) / args.queries
+
+    start = time.perf_counter()
+    for rect in rects:
+        index.count(*rect)
+    count_s = (time.perf_counter() - start) / args.queries
+
+    print(
+        json.dumps(
+            {
+                "detections": args.detections,
+                "build_ms": build_s * 1000,
+                "viewport_px": args.viewport,
+                "mean_hits": float(np.mean(hits)),
+                "query_ms": query_s * 1000,
+                "count_ms": count_s * 1000,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Time the morphological closing modes of the mask postprocessing on real
+mask tiles and measure how far the fast modes drift from the exact one.
+
+Masks are 8-bit PNGs with black (0) foreground on white, e.g. model outputs
+thresholded at config.CUTOFF, or the masks.pack of an inference output
+directory. Run from the repository root:
+    python -m scripts.bench_postprocess path/to/masks --output results.json
+    python -m scripts.bench_postprocess path/to/inference/masks.pack
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from controller.infer_controller import __close_mask, __postprocess_image
+from controller.mask_store import decode_mask
+from controller.tile_store import PackedTileStore
+
+MODES = ("exact", "downscaled", "decomposed")
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def load_masks(path: Path) -> list[np.ndarray]:
+    """Mask tiles, black (0) foreground on white, from a PNG directory or pack."""
+    if path.is_dir():
+        paths = sorted(path.glob("*.png"))
+        return [cv2.imread(p.as_posix(), cv2.IMREAD_GRAYSCALE) for p in paths]
+    store = PackedTileStore(path)
+    try:
+        return [
+            np.where(decode_mask(store.get(level, row, col)), 0, 255).astype(np.uint8)
+            for level in store.levels()
+            for row, col in store.keys(level)
+        ]
+    finally:
+        store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark exact vs fast closing in mask postprocessing"
+    )
+    parser.add_argument(
+        "masks", type=Path, help="Directory of mask PNGs, or a masks.pack"
+    )
+    parser.add_argument("--looseness", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    parser.add_argument("--output", type=Path, help="Write results as JSON here")
+    args = parser.parse_args()
+
+    masks = load_masks(args.masks)
+    if not masks:
+        sys.exit(f"No mask tiles found in {args.masks}")
+    foregrounds = [cv2.bitwise_not(m) for m in masks]
+
+    results = {"tiles": len(masks), "looseness": args.looseness, "modes": {}}
+    closed, outputs = {}, {}
+    for mode in MODES:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            closed[mode] = [__close_mask(f, args.looseness, mode) for f in foregrounds]
+        close_s = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            outputs[mode] = [
+                __postprocess_image(m, looseness=args.looseness, closing=mode)
+                for m in masks
+            ]
+        total_s = (time.perf_counter() - start) / args.repeat
+
+        results["modes"][mode] = {
+            "closing_ms_per_tile": close_s / len(masks) * 1000,
+            "postprocess_ms_per_tile": total_s / len(masks) * 1000,
+        }
+
+    exact = results["modes"]["exact"]
+    for mode, stats in results["modes"].items():
+        pairs = list(zip(closed[mode], closed["exact"]))
+        stats["closing_iou_vs_exact"] = float(
+            np.mean([iou(a > 0, b > 0) for a, b in pairs])
+        )
+        # outputs draw circles in black (0)
+        pairs = list(zip(outputs[mode], outputs["exact"]))
+        stats["output_iou_vs_exact"] = float(
+            np.mean([iou(a == 0, b == 0) for a, b in pairs])
+        )
+        stats["identical_outputs"] = sum(np.array_equal(a, b) for a, b in pairs)
+        stats["speedup_vs_exact"] = (
+            exact["postprocess_ms_per_tile"] / stats["postprocess_ms_per_tile"]
+        )
+
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+Benchmark suite: time tiling, inference, the streamed end-to-end pipeline,
+mask postprocessing and the viewer's tile path on a synthetic slide, and
+compare the results with a stored baseline.
+
+Run from the repository root:
+    python -m scripts.bench_suite --output baseline.json
+    python -m scripts.bench_suite --baseline baseline.json --output run.json
+
+The slide is written by scripts.synthetic_slide and cached in --work-dir by
+its parameters. Without --model a randomly initialised network (fixed seed)
+is used: its detections are meaningless but its timings are not. Times are
+the best of --repeat runs. With --baseline every time (lower is better) and
+rate (higher is better) is compared, and the run exits with status 1 when
+one is worse by more than --tolerance.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+import cv2
+import numpy as np
+
+import config
+from scripts.synthetic_slide import (
+    GENERATOR_VERSION,
+    SlideSpec,
+    write_synthetic_slide,
+)
+
+SUITE_VERSION = 1
+STAGES = ("tiling", "inference", "pipeline", "postprocess", "viewer")
+
+
+def synthetic_slide(work_dir: Path, spec: SlideSpec) -> tuple[Path, dict]:
+    identity = json.dumps([GENERATOR_VERSION, spec._asdict()])
+    key = hashlib.sha1(identity.encode()).hexdigest()[:12]
+    path = work_dir / f"synthetic-{key}.tiff"
+    description_path = path.with_suffix(".json")
+    if not (path.exists() and description_path.exists()):
+        print(f"Writing synthetic slide {path}", flush=True)
+        description = write_synthetic_slide(path, spec)
+        description_path.write_text(json.dumps(description))
+    return path, json.loads(description_path.read_text())
+
+
+def random_model(work_dir: Path) -> Path:
+    import torch
+
+    from model.ai_models.nested_unet import NestedUNet
+
+    path = work_dir / "random_unet.ckpt"
+    if not path.exists():
+        torch.manual_seed(0)
+        out_size = (config.INPUT_IMAGE_HEIGHT, config.INPUT_IMAGE_WIDTH)
+        model = NestedUNet(outSize=out_size)
+        torch.save({"model_state_dict": model.state_dict()}, path)
+    return path
+
+
+def best_of(repeat: int, run: Callable[[], dict]) -> dict:
+    # each run returns its metrics; the fastest one is reported
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    best["runs"] = repeat
+    return best
+
+
+def level0_tiles(tiles_dir: Path) -> list[tuple[int, int]]:
+    from controller.tile_store import open_tile_store
+
+    with open_tile_store(tiles_dir) as store:
+        return store.keys(0)
+
+
+def count_detections(inference_dir: Path) -> int | None:
+    from controller.detections import DETECTIONS_NAME, load_detections
+
+    table = inference_dir / DETECTIONS_NAME
+    return len(load_detections(table)[0]) if table.exists() else None
+
+
+def bench_tiling(slide: Path, tiles_dir: Path, repeat: int) -> dict:
+    from controller.progress import ProgressInfo
+    from controller.wsi_controller import generate_tiles
+
+    def run() -> dict:
+        shutil.rmtree(tiles_dir, ignore_errors=True)
+        info = ProgressInfo("tiling")
+        generate_tiles(slide, tiles_dir, 512, info)
+        return {"stages": info.timings.summary()}
+
+    result = best_of(repeat, run)
+    result["tiles"] = len(level0_tiles(tiles_dir))
+    result["tiles_per_second"] = round(result["tiles"] / result["seconds"], 3)
+    return result
+
+
+def bench_inference(
+    tiles_dir: Path, inference_dir: Path, model_path: Path, repeat: int
+) -> dict:
+    from controller.infer_controller import infer
+    from controller.progress import ProgressInfo
+
+    def run() -> dict:
+        shutil.rmtree(inference_dir, ignore_errors=True)
+        info = ProgressInfo("inference")
+        infer(tiles_dir.as_posix(), inference_dir.as_posix(), str(model_path), info)
+        return {"stages": info.timings.summary()}
+
+    # loading the checkpoint is not part of the steady state
+    from controller.infer_controller import warm_up_model
+
+    warm_up_model(str(model_path)).join()
+    result = best_of(repeat, run)
+    result["tiles"] = len(level0_tiles(tiles_dir))
+    result["tiles_per_second"] = round(result["tiles"] / result["seconds"], 3)
+    result["detections"] = count_detections(inference_dir)
+    result["output_bytes"] = sum(
+        path.stat().st_size for path in inference_dir.rglob("*") if path.is_file()
+    )
+    return result
+
+
+def bench_pipeline(slide: Path, work_dir: Path, model_path: Path, repeat: int) -> dict:
+    from controller.progress import ProgressInfo
+    from controller.workflow import start_image_processing
+
+    tiles_dir = work_dir / "pipeline"
+    inference_dir = work_dir / "pipeline_inference"
+
+    def run() -> dict:
+        shutil.rmtree(tiles_dir, ignore_errors=True)
+        shutil.rmtree(inference_dir, ignore_errors=True)
+        info = ProgressInfo("pipeline")
+        start_image_processing(
+            slide.as_posix(),
+            tiles_dir.as_posix(),
+            inference_dir.as_posix(),
+            info,
+            model_path=str(model_path),
+        )
+        return {"stages": info.timings.summary()}
+
+    result = best_of(repeat, run)
+    result["streamed"] = bool(config.STREAM_TILES_TO_INFERENCE)
+    result["slide_mb_per_second"] = round(
+        slide.stat().st_size / 1e6 / result["seconds"], 3
+    )
+    return result
+
+
+def truth_masks(description: dict, count: int, seed: int) -> list[tuple]:
+    """
+    Mask tiles (black discs on white, ragged edges, specks of noise) drawn
+    from the slide's ground-truth glomeruli on the level-0 tile grid, with
+    the discs each tile fully contains in tile pixels.
+    """
+    from controller.wsi_controller import LEVEL0_TILE_SCALE
+
+    rng = np.random.default_rng(seed)
+    span = 512 * LEVEL0_TILE_SCALE
+    glomeruli = np.array(description["glomeruli"]).reshape(-1, 3)
+    cells = sorted({(int(y // span), int(x // span)) for x, y, _ in glomeruli})
+    masks = []
+    for row, col in cells[:count]:
+        local = glomeruli.copy()
+        local[:, 0] -= col * span
+        local[:, 1] -= row * span
+        local /= LEVEL0_TILE_SCALE
+        mask = np.full((512, 512), 255, dtype=np.uint8)
+        for x, y, radius in local.tolist():
+            wobble = radius * rng.uniform(0.9, 1.1)
+            axes = (round(radius), round(wobble))
+            angle = rng.uniform(0, 180)
+            cv2.ellipse(mask, (round(x), round(y)), axes, angle, 0, 360, 0, -1)
+        specks = rng.random(mask.shape) < 0.00005
+        mask[specks] = 0
+        inside = (
+            (local[:, 0] - local[:, 2] >= 0)
+            & (local[:, 0] + local[:, 2] < 512)
+            & (local[:, 1] - local[:, 2] >= 0)
+            & (local[:, 1] + local[:, 2] < 512)
+        )
+        masks.append((mask, local[inside]))
+    return masks
+
+
+def bench_postprocess(description: dict, count: int, repeat: int) -> dict:
+    from controller.infer_controller import __detect_circles, __postprocess_image
+
+    masks = truth_masks(description, count, seed=0)
+    if not masks:
+        return {"skipped": "no glomeruli on the slide"}
+
+    def run() -> dict:
+        for mask, _ in masks:
+            __postprocess_image(mask)
+        return {}
+
+    result = best_of(repeat, run)
+    result["tiles"] = len(masks)
+    result["ms_per_tile"] = round(result["seconds"] / len(masks) * 1000, 4)
+
+    # a disc counts as found when a circle's centre lies within half its radius
+    found = total = 0
+    for mask, discs in masks:
+        circles, _ = __detect_circles(mask)
+        total += len(discs)
+        for x, y, radius in discs:
+            if len(circles) and (
+                np.hypot(circles[:, 0] - x, circles[:, 1] - y) < radius / 2
+            ).any():
+                found += 1
+    result["recall"] = round(found / total, 4) if total else None
+    return result
+
+
+def bench_viewer(tiles_dir: Path, count: int, repeat: int) -> dict:
+    try:
+        from PySide6.QtWidgets import QApplication
+    except ImportError:
+        return {"skipped": "PySide6 is not installed"}
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication.instance() or QApplication([])
+
+    from view.widgets.viewer import MultiResolutionImageViewer
+
+    start = time.perf_counter()
+    viewer = MultiResolutionImageViewer(tiles_dir)
+    open_s = time.perf_counter() - start
+    keys = viewer.tile_store.keys(0)[:count]
+    if not keys:
+        return {"skipped": "no level-0 tiles"}
+
+    def run() -> dict:
+        for row, col in keys:
+            viewer._composited_pixmap(0, row, col)
+        return {}
+
+    result = best_of(repeat, run)
+    result["open_seconds"] = round(open_s, 4)
+    result["tiles"] = len(keys)
+    result["ms_per_tile"] = round(result["seconds"] / len(keys) * 1000, 4)
+
+    if viewer.detections is not None:
+        # viewport-sized queries of the detection index, in slide pixels
+        rng = np.random.default_rng(0)
+        width, height = viewer.level_sizes[0]
+        scale = viewer.detections.tile_scale
+        corners = rng.uniform(0, 1, (200, 2)) * (width, height)
+        start = time.perf_counter()
+        for x, y in corners:
+            x0, y0, x1, y1 = np.array([x, y, x + 1920, y + 1080]) * scale
+            viewer.detections.query(x0, y0, x1, y1)
+        result["overlay_query_ms"] = round(
+            (time.perf_counter() - start) / len(corners) * 1000, 4
+        )
+    viewer.close()
+    app.processEvents()
+    return result
+
+
+def environment() -> dict:
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "torch": torch.__version__,
+        "device": config.DEVICE,
+        "config": {
+            name: getattr(config, name)
+            for name in (
+                "TILING_WORKERS",
+                "NATIVE_LEVEL_READS",
+                "STREAM_TILES_TO_INFERENCE",
+                "INFERENCE_BATCH_SIZE",
+                "INFERENCE_LOADER_WORKERS",
+                "INFERENCE_BACKEND",
+                "INFERENCE_SHARDS",
+                "QUANTIZATION",
+                "CLOSING_MODE",
+                "ANNOTATION_OUTPUT",
+                "INFERENCE_CACHE",
+            )
+        },
+    }
+
+
+def metrics(results: dict, prefix: str = "") -> dict[str, tuple[float, bool]]:
+    """Comparable leaves as {path: (value, lower is better)}."""
+    found = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if key == "stages":
+            continue  # per-stage breakdowns overlap and are too noisy to gate on
+        if isinstance(value, dict):
+            found.update(metrics(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key.endswith(("seconds", "_ms")):
+                found[path] = (float(value), True)
+            elif key.endswith("per_second"):
+                found[path] = (float(value), False)
+    return found
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[dict]:
+    rows = []
+    current = metrics(results["results"])
+    for path, (before, lower_is_better) in metrics(baseline["results"]).items():
+        if path not in current or before <= 0:
+            continue
+        after = current[path][0]
+        change = (after - before) / before
+        worse = change if lower_is_better else -change
+        rows.append(
+            {
+                "metric": path,
+                "baseline": before,
+                "current": after,
+                "change": round(change, 4),
+                "regressed": worse > tolerance,
+            }
+        )
+    return rows
+
+
+def print_comparison(rows: list[dict]) -> None:
+    print(f"{'metric':<40}{'baseline':>12}{'current':>12}{'change':>9}")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(
+            f"{row['metric']:<40}{row['baseline']:>12.4g}{row['current']:>12.4g}"
+            f"{row['change']:>+9.1%}{flag}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the processing pipeline on a synthetic slide"
+    )
+    parser.add_argument("--work-dir", type=Path, default=Path(".bench"))
+    parser.add_argument("--width", type=int, default=20_000)
+    parser.add_argument("--height", type=int, default=15_000)
+    parser.add_argument("--tissue-fraction", type=float, default=0.35)
+    parser.add_argument("--glomeruli", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", type=Path, help="Checkpoint (default: random)")
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=list(STAGES), help="To run"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage")
+    parser.add_argument("--sample-tiles", type=int, default=200)
+    parser.add_argument(
+        "--inference-cache",
+        action="store_true",
+        help="Turn the inference cache on (off so repeats measure the model)",
+    )
+    parser.add_argument("--output", type=Path, help="Write results as JSON here")
+    parser.add_argument("--baseline", type=Path, help="Results JSON to compare to")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.15, help="Allowed relative slowdown"
+    )
+    args = parser.parse_args()
+
+    config.INFERENCE_CACHE = args.inference_cache
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    spec = SlideSpec(
+        args.width, args.height, args.tissue_fraction, args.glomeruli, args.seed
+    )
+    slide, description = synthetic_slide(args.work_dir, spec)
+    model_path = args.model or random_model(args.work_dir)
+    tiles_dir = args.work_dir / slide.stem
+    inference_dir = args.work_dir / f"{slide.stem}_inference"
+
+    results = {}
+    # later stages reuse the tiles (and detections) of earlier ones
+    if "tiling" in args.stages or not tiles_dir.exists():
+        results["tiling"] = bench_tiling(slide, tiles_dir, args.repeat)
+    if "inference" in args.stages:
+        results["inference"] = bench_inference(
+            tiles_dir, inference_dir, model_path, args.repeat
+        )
+    if "pipeline" in args.stages:
+        results["pipeline"] = bench_pipeline(
+            slide, args.work_dir, model_path, args.repeat
+        )
+    if "postprocess" in args.stages:
+        results["postprocess"] = bench_postprocess(
+            description, args.sample_tiles, args.repeat
+        )
+    if "viewer" in args.stages:
+        results["viewer"] = bench_viewer(tiles_dir, args.sample_tiles, args.repeat)
+
+    report = {
+        "suite_version": SUITE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "slide": {
+            "spec": json.loads(json.dumps(spec._asdict())),  # as stored
+            "levels": description["levels"],
+            "glomeruli": len(description["glomeruli"]),
+            "file_mb": round(slide.stat().st_size / 1e6, 3),
+        },
+        "model": "random" if args.model is None else args.model.as_posix(),
+        "results": results,
+    }
+
+    regressed = []
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("slide", {}).get("spec") != report["slide"]["spec"]:
+            print("Warning: the baseline ran on a different slide", file=sys.stderr)
+        rows = compare(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.baseline.as_posix(), "metrics": rows}
+        print_comparison(rows)
+        regressed = [row["metric"] for row in rows if row["regressed"]]
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+    if regressed:
+        sys.exit(f"{len(regressed)} metrics regressed beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Generate synthetic whole-slide images: tiled, deflate-compressed pyramidal
+TIFFs that openslide opens as generic TIFF slides. Tissue is a smooth random
+blob field covering a chosen fraction of the slide; fake glomeruli are dark
+discs scattered over the tissue. The same seed always gives the same slide.
+
+Run from the repository root:
+    python -m scripts.synthetic_slide slide.tiff --width 20000 --height 15000
+"""
+
+import argparse
+import functools
+import json
+import struct
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+TIFF_TILE = 256
+LEVEL_DOWNSAMPLE = 4
+FIELD_PIXEL = 64  # level-0 pixels per pixel of the tissue field
+TEXTURE_SIZE = 1024
+# level-0 pixels between glomeruli, wider than the postprocessing closing
+# (30 px at level-0 tile resolution) so neighbours stay separate objects
+MIN_GAP = 100
+# bump when the same spec starts producing different pixels
+GENERATOR_VERSION = 1
+
+BACKGROUND = np.array([246, 245, 247], dtype=np.int16)
+TISSUE = np.array([226, 168, 200], dtype=np.int16)
+GLOMERULUS = (150, 82, 162)
+
+# TIFF field types
+SHORT, LONG, ASCII = 3, 4, 2
+
+
+class SlideSpec(NamedTuple):
+    width: int
+    height: int
+    tissue_fraction: float
+    glomeruli: int
+    seed: int
+    radius_range: tuple[int, int] = (150, 350)  # level-0 pixels
+
+
+def tissue_field(spec: SlideSpec) -> tuple[np.ndarray, float]:
+    """Smooth noise at FIELD_PIXEL resolution and its tissue threshold."""
+    rng = np.random.default_rng(spec.seed)
+    h = -(-spec.height // FIELD_PIXEL)
+    w = -(-spec.width // FIELD_PIXEL)
+    noise = rng.random((h, w), dtype=np.float32)
+    sigma = max(min(h, w) / 12, 1.0)
+    field = cv2.GaussianBlur(noise, (0, 0), sigma, borderType=cv2.BORDER_REFLECT)
+    # fade out towards the slide border so tissue keeps clear of it
+    margin = max(min(h, w) / 10, 1.0)
+    ys, xs = np.arange(h), np.arange(w)
+    edge = np.minimum.outer(np.minimum(ys, h - 1 - ys), np.minimum(xs, w - 1 - xs))
+    field = field - field.min()
+    field *= np.clip(edge / margin, 0, 1).astype(np.float32)
+    threshold = float(np.quantile(field, 1.0 - spec.tissue_fraction))
+    return field, threshold
+
+
+def place_glomeruli(
+    spec: SlideSpec, field: np.ndarray, threshold: float
+) -> np.ndarray:
+    """
+    (n, 3) float array of x, y, radius in level-0 pixels: discs on tissue at
+    least MIN_GAP apart, so each one is a separate ground-truth detection. Fewer
+    than `spec.glomeruli` are returned when the tissue is too crowded.
+    """
+    rng = np.random.default_rng(spec.seed + 1)
+    cells = np.argwhere(field > threshold)
+    placed = np.zeros((0, 3))
+    if len(cells) == 0:
+        return placed
+    for _ in range(spec.glomeruli * 50):
+        if len(placed) == spec.glomeruli:
+            break
+        cy, cx = cells[rng.integers(len(cells))] + rng.random(2)
+        radius = rng.uniform(*spec.radius_range)
+        disc = np.array([cx * FIELD_PIXEL, cy * FIELD_PIXEL, radius])
+        gaps = np.hypot(*(placed[:, :2] - disc[:2]).T) - placed[:, 2] - disc[2]
+        if (gaps >= MIN_GAP).all():
+            placed = np.vstack((placed, disc))
+    return placed
+
+
+@functools.lru_cache(maxsize=4)
+def __texture(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(-6, 7, (TEXTURE_SIZE, TEXTURE_SIZE, 1), dtype=np.int16)
+
+
+def render_region(
+    spec: SlideSpec,
+    field: np.ndarray,
+    threshold: float,
+    glomeruli: np.ndarray,
+    x0: int,
+    y0: int,
+    size: tuple[int, int],
+    downsample: int,
+) -> np.ndarray:
+    """RGB pixels of a region at `downsample`, top-left at level-0 (x0, y0)."""
+    w, h = size
+    # dst pixel centres mapped into the field, so every level agrees
+    step = downsample / FIELD_PIXEL
+    matrix = np.float32(
+        [
+            [step, 0, (x0 + 0.5 * downsample) / FIELD_PIXEL - 0.5],
+            [0, step, (y0 + 0.5 * downsample) / FIELD_PIXEL - 0.5],
+        ]
+    )
+    local = cv2.warpAffine(
+        field,
+        matrix,
+        (w, h),
+        flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+    tissue = local > threshold
+
+    # one grey-level texture shared by the channels keeps the file small;
+    # regions take pseudo-random windows of a precomputed noise image
+    if w <= TEXTURE_SIZE and h <= TEXTURE_SIZE:
+        ty = (y0 // downsample * 7919) % (TEXTURE_SIZE - h + 1)
+        tx = (x0 // downsample * 104729) % (TEXTURE_SIZE - w + 1)
+        texture = __texture(spec.seed)[ty : ty + h, tx : tx + w]
+    else:
+        rng = np.random.default_rng((spec.seed, downsample, x0, y0))
+        texture = rng.integers(-6, 7, (h, w, 1), dtype=np.int16)
+    rgb = np.where(tissue[..., None], TISSUE + texture, BACKGROUND + texture // 3)
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+
+    x1, y1 = x0 + w * downsample, y0 + h * downsample
+    x, y, radius = glomeruli.T
+    near = (x + radius >= x0) & (x - radius <= x1)
+    near &= (y + radius >= y0) & (y - radius <= y1)
+    for x, y, radius in glomeruli[near].tolist():
+        centre = (round((x - x0) / downsample), round((y - y0) / downsample))
+        cv2.circle(rgb, centre, round(radius / downsample), GLOMERULUS, -1, cv2.LINE_AA)
+
+    # pixels past the slide edge are never shown; keep them blank
+    valid_w = max(min(w, -(-(spec.width - x0) // downsample)), 0)
+    valid_h = max(min(h, -(-(spec.height - y0) // downsample)), 0)
+    rgb[valid_h:] = 255
+    rgb[:, valid_w:] = 255
+    return rgb
+
+
+def __ifd_entry(tag: int, field_type: int, values, extra: bytearray, base: int):
+    # values that do not fit the 4-byte slot go to `extra`, placed at `base`
+    if field_type == ASCII:
+        payload = values.encode("ascii") + b"\0"
+        count = len(payload)
+    else:
+        values = list(values)
+        count = len(values)
+        code = "H" if field_type == SHORT else "I"
+        payload = struct.pack(f"<{count}{code}", *values)
+    if len(payload) <= 4:
+        return struct.pack("<HHI", tag, field_type, count) + payload.ljust(4, b"\0")
+    offset = base + len(extra)
+    extra += payload
+    if len(extra) % 2:
+        extra += b"\0"  # word alignment
+    return struct.pack("<HHII", tag, field_type, count, offset)
+
+
+def write_synthetic_slide(
+    path: str | Path, spec: SlideSpec, compression_level: int = 1
+) -> dict:
+    """
+    Write the slide to `path` and return its description: dimensions, level
+    sizes and the ground-truth glomeruli (level-0 x, y, radius).
+    """
+    path = Path(path)
+    field, threshold = tissue_field(spec)
+    glomeruli = place_glomeruli(spec, field, threshold)
+
+    levels = [1]
+    while max(spec.width, spec.height) // (levels[-1] * LEVEL_DOWNSAMPLE) >= 1024:
+        levels.append(levels[-1] * LEVEL_DOWNSAMPLE)
+
+    with open(path, "wb") as f:
+        f.write(b"II*\0" + struct.pack("<I", 0))  # first IFD offset patched below
+        previous_next = 4
+        for index, downsample in enumerate(levels):
+            width = -(-spec.width // downsample)
+            height = -(-spec.height // downsample)
+            rows, cols = -(-height // TIFF_TILE), -(-width // TIFF_TILE)
+
+            offsets, counts = [], []
+            for row in range(rows):
+                for col in range(cols):
+                    tile = render_region(
+                        spec,
+                        field,
+                        threshold,
+                        glomeruli,
+                        col * TIFF_TILE * downsample,
+                        row * TIFF_TILE * downsample,
+                        (TIFF_TILE, TIFF_TILE),
+                        downsample,
+                    )
+                    data = zlib.compress(tile.tobytes(), compression_level)
+                    offsets.append(f.tell())
+                    counts.append(len(data))
+                    f.write(data)
+            if f.tell() % 2:
+                f.write(b"\0")
+
+            tags = [
+                (254, LONG, [0 if index == 0 else 1]),  # reduced-resolution image
+                (256, LONG, [width]),
+                (257, LONG, [height]),
+                (258, SHORT, [8, 8, 8]),
+                (259, SHORT, [8]),  # deflate
+                (262, SHORT, [2]),  # RGB
+                (277, SHORT, [3]),
+                (284, SHORT, [1]),  # chunky
+                (322, LONG, [TIFF_TILE]),
+                (323, LONG, [TIFF_TILE]),
+                (324, LONG, offsets),
+                (325, LONG, counts),
+            ]
+            if index == 0:
+                description = f"Synthetic slide {json.dumps(spec._asdict())}"
+                tags.insert(5, (270, ASCII, description))
+
+            ifd_offset = f.tell()
+            ifd_size = 2 + 12 * len(tags) + 4
+            extra = bytearray()
+            entries = b"".join(
+                __ifd_entry(tag, kind, values, extra, ifd_offset + ifd_size)
+                for tag, kind, values in tags
+            )
+            f.write(struct.pack("<H", len(tags)) + entries + struct.pack("<I", 0))
+            f.write(extra)
+            if f.tell() >= 1 << 32:
+                raise ValueError("Synthetic slide exceeds the classic TIFF 4 GiB limit")
+
+            f.seek(previous_next)
+            f.write(struct.pack("<I", ifd_offset))
+            f.seek(0, 2)
+            previous_next = ifd_offset + 2 + 12 * len(tags)
+
+    return {
+        "path": path.as_posix(),
+        "spec": spec._asdict(),
+        "levels": [
+            [-(-spec.width // d), -(-spec.height // d), d] for d in levels
+        ],
+        "glomeruli": glomeruli.round(2).tolist(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic pyramidal TIFF")
+    parser.add_argument("output", type=Path, help="TIFF file to write")
+    parser.add_argument("--width", type=int, default=20_000)
+    parser.add_argument("--height", type=int, default=15_000)
+    parser.add_argument("--tissue-fraction", type=float, default=0.35)
+    parser.add_argument("--glomeruli", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = SlideSpec(
+        args.width, args.height, args.tissue_fraction, args.glomeruli, args.seed
+    )
+    description = write_synthetic_slide(args.output, spec)
+    args.output.with_suffix(".json").write_text(json.dumps(description, indent=2))
+    print(f"Wrote {args.output} ({len(description['levels'])} levels)")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,11 @@ from PySide6.QtWidgets import (
     QVBoxLayout,
 )
 
+from controller.progress import ProgressInfo
 from controller.temp_dir import TEMP_DIR
 from model.project.image import ImageObject
 from state import get_state
 from state.commands.image_commands import AddImageCommand
-from state.progress_info import ProgressInfo
 from view.ui.compiled.main_window import Ui_MainWindow
 from view.widgets.image_item import ImageItem
 from view.widgets.progress_item import ProgressItem
@@ -163,6 +163,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
     def __view_image(self, image: ImageObject) -> None:
         old = self.takeCentralWidget()
         if old is not None:
+            old.close()  # releases the viewer's tile store
             old.deleteLater()
         viewer = MultiResolutionImageViewer(TEMP_DIR.joinpath(image.name), parent=self)
         self.setCentralWidget(viewer)
@@ -3,20 +3,35 @@ from pathlib import Path
 
 import numpy as np
 from PySide6.QtCore import QPointF, QRectF, Qt
-from PySide6.QtGui import QImage, QPainter, QPixmap
-from PySide6.QtWidgets import QGraphicsPixmapItem, QGraphicsScene, QGraphicsView
+from PySide6.QtGui import QColor, QImage, QPainter, QPixmap
+from PySide6.QtWidgets import (
+    QGraphicsEllipseItem,
+    QGraphicsPixmapItem,
+    QGraphicsScene,
+    QGraphicsView,
+)
+
+from controller.detections import load_detection_index
+from controller.mask_store import load_mask_store, mask_overlay
+from controller.tile_store import open_tile_store
 
 
 class MultiResolutionImageViewer(QGraphicsView):
     """
-    Tile viewer for folders laid out as:
+    Tile viewer for a slide's tile store (see controller.tile_store):
         tiles_root/
+            tiles.pack      <- every level packed in one file
+        or
             level0/         <- highest-res
             level1/
             ...
             levelN/         <- lowest-res (fewest tiles)
 
-    Each level folder contains 512×512 PNGs named  tile_<row>_<col>.png
+    Tiles are 512×512 PNGs addressed by (level, row, col). Detections from
+    the slide's `*_inference/detections.bin` are drawn on level 0 as circles,
+    fetched per viewport through the table's spatial index; mask outputs
+    (`masks.pack`, or per-tile mask PNGs of older outputs) are composited
+    into the tiles.
     """
 
     TILE_SIZE = 512  # physical tile edge length in *level-pixel* units
@@ -27,6 +42,7 @@ class MultiResolutionImageViewer(QGraphicsView):
     MAX_SCALE = 64.0  # and from zooming into oblivion
     WHITE_CUTOFF = 245  # ≥ this on every channel counts as white
     OVERLAY_OPACITY = 0.40  # Overlay opacity (40%)
+    OVERLAY_COLOR = QColor(255, 0, 0)
 
     # ────────────────────────────────────────────────────────────────
     # ctor
@@ -38,7 +54,14 @@ class MultiResolutionImageViewer(QGraphicsView):
         self.inference_root = tiles_root.parent.joinpath(tiles_root.stem + "_inference")
         self.annotations = True
 
-        self._discover_levels()  # populates self.level_paths, self.level_sizes
+        self.tile_store = open_tile_store(tiles_root)
+        self._discover_levels()  # populates self.levels, self.level_sizes
+        # detection table with its spatial index, None for mask outputs
+        self.detections = load_detection_index(self.inference_root)
+        # run-length encoded mask tiles, only used without a detection table
+        self.masks = None
+        if self.detections is None:
+            self.masks = load_mask_store(self.inference_root)
 
         self.setRenderHints(self.renderHints() | QPainter.SmoothPixmapTransform)
         self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
@@ -51,9 +74,11 @@ class MultiResolutionImageViewer(QGraphicsView):
 
         # tile cache {(level,row,col): QGraphicsPixmapItem}
         self._tiles = {}
+        # level-0 detection circles {table id: QGraphicsEllipseItem}
+        self._overlays = {}
 
         # start at lowest-resolution overview (largest level index)
-        self._current_level = len(self.level_paths) - 1
+        self._current_level = len(self.levels) - 1
         self._set_scene_rect_for_level(self._current_level)
         self.fitInView(self.scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
 
@@ -64,30 +89,21 @@ class MultiResolutionImageViewer(QGraphicsView):
     # level discovery helpers
     # ────────────────────────────────────────────────────────────────
     def _discover_levels(self):
-        """Find level folders and their pixel sizes."""
-        paths = sorted(
-            [
-                p
-                for p in self.tiles_root.iterdir()
-                if p.is_dir() and p.name.startswith("level")
-            ],
-            key=lambda p: int(p.name[5:]),
-        )
-        if not paths:
-            raise RuntimeError(f"No level* folders in {self.tiles_root}")
+        """Find stored levels and their pixel sizes."""
+        self.levels = self.tile_store.levels()
+        if not self.levels:
+            raise RuntimeError(f"No tile levels in {self.tiles_root}")
 
-        self.level_paths = paths
         self.level_sizes = []
-        for lp in self.level_paths:
-            # find width/height by scanning filenames
-            w = h = -1
-            for tile in lp.glob("tile_*.png"):
-                _, r, c = tile.stem.split("_")
-                w = max(w, int(c))
-                h = max(h, int(r))
-            self.level_sizes.append(
-                ((w + 1) * self.TILE_SIZE, (h + 1) * self.TILE_SIZE)
-            )
+        for level in self.levels:
+            rows, cols = self.tile_store.grid(level)
+            self.level_sizes.append((cols * self.TILE_SIZE, rows * self.TILE_SIZE))
+
+    def closeEvent(self, ev):
+        self.tile_store.close()
+        if self.masks is not None:
+            self.masks.close()
+        super().closeEvent(ev)
 
     # ────────────────────────────────────────────────────────────────
     # event overrides
@@ -146,7 +162,7 @@ class MultiResolutionImageViewer(QGraphicsView):
         tile_px = one_tile_scene.width()
 
         level = self._current_level
-        if tile_px < self.MIN_TILE_SCREEN and level < len(self.level_paths) - 1:
+        if tile_px < self.MIN_TILE_SCREEN and level < len(self.levels) - 1:
             level += 1  # go to lower-res level
         elif tile_px > self.MAX_TILE_SCREEN and level > 0:
             level -= 1  # go to higher-res level
@@ -179,9 +195,7 @@ class MultiResolutionImageViewer(QGraphicsView):
         )
 
         # 5. clear old tiles, keep viewport anchored
-        for item in self._tiles.values():
-            self.scene.removeItem(item)
-        self._tiles.clear()
+        self._clear_tiles()
 
         self.centerOn(new_centre)
 
@@ -193,12 +207,19 @@ class MultiResolutionImageViewer(QGraphicsView):
     # ────────────────────────────────────────────────────────────────
     # tile loading / purging
     # ────────────────────────────────────────────────────────────────
+    def _clear_tiles(self):
+        for item in self._tiles.values():
+            self.scene.removeItem(item)
+        self._tiles.clear()
+        for item in self._overlays.values():
+            self.scene.removeItem(item)
+        self._overlays.clear()
+
     def _update_visible_tiles(self, reset: bool = False):
         """Ensure tiles intersecting viewport are loaded; others dropped."""
         if reset:
-            self._tiles = {}
+            self._clear_tiles()
         lvl = self._current_level
-        lvl_path = self.level_paths[lvl]
 
         # visible rectangle in *scene* coords
         vis_rect = self.mapToScene(self.viewport().rect()).boundingRect()
@@ -228,8 +249,7 @@ class MultiResolutionImageViewer(QGraphicsView):
                 key = (lvl, r, c)
                 if key in self._tiles:
                     continue
-                tile_file = lvl_path / f"tile_{r}_{c}.png"
-                if not tile_file.exists():
+                if not self.tile_store.has(lvl, r, c):
                     continue
                 pix = self._composited_pixmap(self._current_level, r, c)
                 item = QGraphicsPixmapItem(pix)
@@ -237,27 +257,101 @@ class MultiResolutionImageViewer(QGraphicsView):
                 self.scene.addItem(item)
                 self._tiles[key] = item
 
+        self._update_overlays(vis_rect)
+
+    def _update_overlays(self, vis_rect: QRectF):
+        """Draw the detections overlapping the viewport as translucent circles."""
+        visible = set()
+        if self._current_level == 0 and self.annotations and self.detections:
+            # table coordinates are slide pixels; level-0 scene pixels are coarser
+            scale = self.detections.tile_scale
+            ids = self.detections.query(
+                vis_rect.left() * scale,
+                vis_rect.top() * scale,
+                vis_rect.right() * scale,
+                vis_rect.bottom() * scale,
+            )
+            visible = set(ids.tolist())
+
+        for det_id in self._overlays.keys() - visible:
+            self.scene.removeItem(self._overlays.pop(det_id))
+
+        for det_id in visible - self._overlays.keys():
+            record = self.detections.table[det_id]
+            scale = self.detections.tile_scale
+            x, y = float(record["x"]) / scale, float(record["y"]) / scale
+            radius = float(record["radius"]) / scale
+            item = QGraphicsEllipseItem(x - radius, y - radius, 2 * radius, 2 * radius)
+            item.setPen(Qt.PenStyle.NoPen)
+            item.setBrush(self.OVERLAY_COLOR)
+            item.setOpacity(self.OVERLAY_OPACITY)
+            item.setZValue(1)  # above the tile pixmaps
+            self.scene.addItem(item)
+            self._overlays[det_id] = item
+
     def _composited_pixmap(self, level: int, row: int, col: int) -> QPixmap:
         """
-        Return the base tile with inference overlay (level 0 only).
-        White pixels in the inference tile become fully transparent.
-        Non-transparent pixels are recolored red before compositing.
+        Return the base tile with inference overlay (level 0 only): the
+        tile's mask drawn over it at OVERLAY_OPACITY.
         """
-        base_path = self.level_paths[level] / f"tile_{row}_{col}.png"
-        if base_path.exists():
-            base_pix = QPixmap(base_path.as_posix())
-        else:
+        data = self.tile_store.get(level, row, col)
+        base_pix = QPixmap()
+        if data is None or not base_pix.loadFromData(data, "PNG"):
             base_pix = QPixmap(512, 512)
             base_pix.fill(Qt.GlobalColor.white)
 
-        # Only apply overlay for level 0 and if inference_root is set
+        # Only apply overlay for level 0 and if inference_root is set; a
+        # detection table is drawn as vector items instead
         if level != 0 or not self.annotations or not self.inference_root:
             return base_pix
+        if self.detections is not None:
+            return base_pix
 
-        inf_path = self.inference_root / base_path.name
-        if not inf_path.exists():
+        inf_pix = self._mask_pixmap(row, col, base_pix)
+        if inf_pix is None:
             return base_pix
 
+        # Composite overlay with base tile at specified opacity
+        composite = QPixmap(base_pix.size())
+        composite.fill(Qt.transparent)
+
+        painter = QPainter(composite)
+        painter.drawPixmap(0, 0, base_pix)
+        painter.setOpacity(self.OVERLAY_OPACITY)
+        painter.drawPixmap(0, 0, inf_pix)
+        painter.end()
+
+        return composite
+
+    def _mask_pixmap(self, row: int, col: int, base_pix: QPixmap) -> QPixmap | None:
+        """
+        The level-0 tile's mask at the size of `base_pix`, foreground colored
+        and the rest transparent; None when the tile has no mask.
+        """
+        if self.masks is not None:
+            data = self.masks.get(0, row, col)
+            if data is None:
+                return None
+            pixels = mask_overlay(data, self.OVERLAY_COLOR.rgba())
+            height, width = pixels.shape
+            # wraps `pixels` without a copy; fromImage() makes the pixmap's own
+            inf_img = QImage(
+                pixels.data, width, height, 4 * width, QImage.Format.Format_ARGB32
+            )
+            if inf_img.size() != base_pix.size():
+                inf_img = inf_img.scaled(
+                    base_pix.size(),
+                    Qt.AspectRatioMode.IgnoreAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation,
+                )
+            return QPixmap.fromImage(inf_img)
+
+        # per-tile mask PNG of an older output: white pixels become fully
+        # transparent, the others are recolored
+        inf_path = self.inference_root / f"tile_{row}_{col}.png"
+        if not inf_path.exists():
+            return None
+
         # Load inference image and convert to ARGB32 format
         inf_img = (
             QImage(inf_path.as_posix())
@@ -269,7 +363,7 @@ class MultiResolutionImageViewer(QGraphicsView):
             )
         )
         if inf_img.isNull():
-            return base_pix
+            return None
 
         # Access pixel data as numpy array
         ptr = inf_img.bits()
@@ -286,16 +380,4 @@ class MultiResolutionImageViewer(QGraphicsView):
         arr[..., 1][non_transparent_mask] = 0  # Green channel
         arr[..., 2][non_transparent_mask] = 0  # Blue channel
 
-        inf_pix = QPixmap.fromImage(inf_img)
-
-        # Composite overlay with base tile at specified opacity
-        composite = QPixmap(base_pix.size())
-        composite.fill(Qt.transparent)
-
-        painter = QPainter(composite)
-        painter.drawPixmap(0, 0, base_pix)
-        painter.setOpacity(self.OVERLAY_OPACITY)
-        painter.drawPixmap(0, 0, inf_pix)
-        painter.end()
-
-        return composite
+        return QPixmap.fromImage(inf_img)